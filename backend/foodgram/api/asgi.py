@@ -0,0 +1,217 @@
+import asyncio
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from time import perf_counter
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+
+from .metrics import registry
+
+# Эндпоинты только для чтения, которые обслуживаются отдельным пулом
+# потоков и не ждут освобождения потоков, занятых записью.
+READ_ONLY_PATH_RE = re.compile(
+    r'^/api/(?:(?:tags|ingredients|recipes)/(?:\d+/)?'
+    r'|recipes/download_shopping_cart/)$'
+)
+READ_ONLY_METHODS = ('GET', 'HEAD')
+
+
+def build_environ(scope, body):
+    """WSGI environ для HTTP-запроса ASGI (PEP 3333)."""
+
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf8').decode(
+            'latin1'
+        ),
+        'PATH_INFO': scope['path'].encode('utf8').decode('latin1'),
+        'QUERY_STRING': scope['query_string'].decode('ascii'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f'HTTP/{scope["http_version"]}',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+    for name, value in scope['headers']:
+        name = name.decode('latin1').upper().replace('-', '_')
+        value = value.decode('latin1')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = f'HTTP_{name}'
+        if name in environ:
+            # Повторяющиеся заголовки запроса объединяются, как в CGI;
+            # значения Cookie разделяются точкой с запятой (RFC 6265).
+            separator = '; ' if name == 'HTTP_COOKIE' else ','
+            value = f'{environ[name]}{separator}{value}'
+        environ[name] = value
+    return environ
+
+
+class ASGIHandler:
+    """ASGI-приложение для Django 2.2, где нет асинхронных представлений.
+
+    Соединения, чтение тела запроса и отправка ответа обслуживаются
+    циклом событий, поэтому медленные клиенты не занимают потоки.
+    Сам запрос выполняется обычным WSGIHandler в пуле потоков: ответы
+    и промежуточные слои те же, что в режиме WSGI. GET-запросы
+    к READ_ONLY_PATH_RE идут в отдельный пул ASGI_READ_THREADS,
+    остальные - в пул ASGI_THREADS. Время ожидания свободного потока
+    попадает в метрики пула при API_METRICS_ENABLED.
+    """
+
+    def __init__(self):
+        self.wsgi_handler = WSGIHandler()
+        self.executors = {
+            pool: ThreadPoolExecutor(
+                max_workers=size, thread_name_prefix=pool
+            )
+            for pool, size in (
+                ('asgi-read', settings.ASGI_READ_THREADS),
+                ('asgi', settings.ASGI_THREADS),
+            )
+        }
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            raise ValueError(
+                f'Тип соединения не поддерживается: {scope["type"]}'
+            )
+        body = await self.read_body(receive)
+        if body is None:
+            return
+        loop = asyncio.get_event_loop()
+        queue = asyncio.Queue(maxsize=settings.ASGI_RESPONSE_BUFFER)
+        pool = self.get_pool(scope)
+        future = loop.run_in_executor(
+            self.executors[pool],
+            self.run_wsgi,
+            build_environ(scope, body),
+            loop,
+            queue,
+            pool,
+            perf_counter(),
+        )
+        try:
+            started = await self.send_response(queue, send)
+        except BaseException:
+            await self.discard_response(queue)
+            raise
+        if started:
+            await send({'type': 'http.response.body'})
+        await future
+
+    async def send_response(self, queue, send):
+        """Отправляет клиенту заголовки и части ответа из очереди
+        по мере их появления, до None. False, если поток завершился,
+        не начав ответ."""
+
+        start = await queue.get()
+        if start is None:
+            return False
+        status, headers = start
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': headers,
+        })
+        chunk = await queue.get()
+        while chunk is not None:
+            await send({
+                'type': 'http.response.body',
+                'body': chunk,
+                'more_body': True,
+            })
+            chunk = await queue.get()
+        return True
+
+    async def discard_response(self, queue):
+        """Выбирает из очереди остаток ответа, который уже не отправить,
+        чтобы поток не ждал места в очереди и вернулся в пул."""
+
+        chunk = await queue.get()
+        while chunk is not None:
+            chunk = await queue.get()
+
+    def get_pool(self, scope):
+        if (
+            scope['method'] in READ_ONLY_METHODS
+            and READ_ONLY_PATH_RE.match(scope['path'])
+        ):
+            return 'asgi-read'
+        return 'asgi'
+
+    def run_wsgi(self, environ, loop, queue, pool, submitted):
+        """Выполняет запрос в потоке пула и передаёт заголовки и части
+        ответа в очередь цикла событий, а в конце - None. Очередь
+        ограничена ASGI_RESPONSE_BUFFER: если клиент читает медленно,
+        поток ждёт, а не накапливает ответ в памяти. Ответ целиком,
+        включая потоковый, читается в том же потоке, что и обработка
+        запроса: соединения с БД у Django свои в каждом потоке.
+        Заголовки передаются парами, повторяющиеся (Set-Cookie)
+        не склеиваются; пробел, который WSGIHandler оставляет в начале
+        значения Set-Cookie, отбрасывается."""
+
+        def put(item):
+            asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+
+        def start_response(status, response_headers, exc_info=None):
+            put((
+                int(status[:3]),
+                [
+                    (
+                        name.lower().encode('latin1'),
+                        value.strip().encode('latin1'),
+                    )
+                    for name, value in response_headers
+                ],
+            ))
+
+        if settings.API_METRICS_ENABLED:
+            registry.record_wait(pool, perf_counter() - submitted)
+        try:
+            response = self.wsgi_handler(environ, start_response)
+            try:
+                for chunk in response:
+                    if chunk:
+                        put(chunk)
+            finally:
+                response.close()
+        finally:
+            put(None)
+
+    async def read_body(self, receive):
+        """Тело запроса целиком. None, если клиент отключился."""
+
+        body = BytesIO()
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return None
+            body.write(message.get('body', b''))
+            if not message.get('more_body'):
+                body.seek(0)
+                return body
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                for executor in self.executors.values():
+                    executor.shutdown(wait=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
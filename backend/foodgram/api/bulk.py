@@ -0,0 +1,194 @@
+import json
+from itertools import islice
+
+from django.db import connection, transaction
+from recipes.models import Ingredient, Recipe, Tag
+from rest_framework.parsers import BaseParser
+
+from .common import create_recipe_relations, get_ingredient_ids
+from .images import schedule_renditions
+from .serializers import RecipeImportSerializer
+
+EXPORT_CHUNK_SIZE = 500
+
+
+def read_ndjson(lines):
+    """Записи NDJSON по одной на строку. Строка с некорректным JSON
+    возвращается как есть и попадёт в отчёт об ошибках импорта."""
+
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            yield line
+
+
+class NDJSONParser(BaseParser):
+    """Разбирает тело запроса построчно, не загружая его целиком."""
+
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        return read_ndjson(stream or ())
+
+
+def bulk_create_recipes(recipes):
+    """bulk_create для рецептов с заполнением id. Если СУБД не
+    возвращает id вставленных строк (SQLite), рецепты сохраняются
+    по одному: id берётся из того же соединения, а не из последних
+    строк таблицы, куда могли попасть чужие рецепты."""
+
+    if connection.features.can_return_ids_from_bulk_insert:
+        Recipe.objects.bulk_create(recipes)
+        return
+    for recipe in recipes:
+        recipe.save(force_insert=True)
+
+
+def store_image(image, stored):
+    """Сохраняет загруженное изображение один раз на пакет: одинаковые
+    файлы имеют одно имя по хэшу содержимого."""
+
+    if image is None or isinstance(image, str):
+        return image
+    if image.name not in stored:
+        field = Recipe._meta.get_field('image')
+        stored[image.name] = field.storage.save(
+            field.generate_filename(None, image.name), image
+        )
+    return stored[image.name]
+
+
+def import_batch(batch, author):
+    """Проверяет и сохраняет пакет пар (номер строки, запись).
+    Тэги и ингредиенты всего пакета ищутся двумя запросами, рецепты
+    и их связи вставляются в одной транзакции."""
+
+    errors = []
+    valid = []
+    for line, record in batch:
+        serializer = RecipeImportSerializer(data=record)
+        if serializer.is_valid():
+            valid.append((line, serializer.validated_data))
+        else:
+            errors.append({'line': line, 'errors': serializer.errors})
+
+    tags = Tag.objects.in_bulk(
+        {slug for _, data in valid for slug in data['tags']},
+        field_name='slug',
+    )
+    ingredients = {
+        (ingredient.name, ingredient.measurement_unit): ingredient
+        for ingredient in Ingredient.objects.filter(name__in={
+            item['name'] for _, data in valid for item in data['ingredients']
+        })
+    }
+    items = []
+    stored_images = {}
+    for line, data in valid:
+        record_errors = {}
+        missing_tags = [slug for slug in data['tags'] if slug not in tags]
+        if missing_tags:
+            record_errors['tags'] = [
+                f'Тэг не найден: {slug}' for slug in missing_tags
+            ]
+        missing_ingredients = [
+            item for item in data['ingredients']
+            if (item['name'], item['measurement_unit']) not in ingredients
+        ]
+        if missing_ingredients:
+            record_errors['ingredients'] = [
+                f'Ингредиент не найден: {item["name"]} '
+                f'({item["measurement_unit"]})'
+                for item in missing_ingredients
+            ]
+        if record_errors:
+            errors.append({'line': line, 'errors': record_errors})
+            continue
+        recipe_ingredients = [
+            {
+                'ingredient': {'id': ingredients[(
+                    item['name'], item['measurement_unit']
+                )]},
+                'amount': item['amount'],
+            }
+            for item in data['ingredients']
+        ]
+        recipe = Recipe(
+            author=author,
+            name=data['name'],
+            text=data['text'],
+            cooking_time=data['cooking_time'],
+            image=store_image(data.get('image'), stored_images),
+            ingredients_count=len(recipe_ingredients),
+            ingredient_ids=get_ingredient_ids(recipe_ingredients),
+        )
+        items.append((
+            recipe,
+            recipe_ingredients,
+            {tags[slug].id: tags[slug] for slug in data['tags']},
+        ))
+
+    if items:
+        with transaction.atomic():
+            bulk_create_recipes([recipe for recipe, _, _ in items])
+            create_recipe_relations(items)
+            for recipe, _, _ in items:
+                schedule_renditions(recipe.image)
+    return len(items), errors
+
+
+def import_recipes(records, author, batch_size):
+    """Импорт рецептов автора author из последовательности записей.
+    Записи с ошибками пропускаются и перечисляются в отчёте
+    с номером строки."""
+
+    report = {'created': 0, 'errors': []}
+    numbered = enumerate(records, start=1)
+    while True:
+        batch = list(islice(numbered, batch_size))
+        if not batch:
+            return report
+        created, errors = import_batch(batch, author)
+        report['created'] += created
+        report['errors'].extend(errors)
+
+
+def export_recipe(recipe):
+    return {
+        'name': recipe.name,
+        'text': recipe.text,
+        'cooking_time': recipe.cooking_time,
+        'image': recipe.image.name or None,
+        'author': recipe.author.username,
+        'tags': [tag.slug for tag in recipe.tag.all()],
+        'ingredients': [
+            {
+                'name': item.ingredient.name,
+                'measurement_unit': item.ingredient.measurement_unit,
+                'amount': item.amount,
+            }
+            for item in recipe.recipes.all()
+        ],
+    }
+
+
+def export_recipes(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """Строки NDJSON в формате импорта. Рецепты читаются пачками
+    по возрастанию id, так что память не зависит от их числа.
+    queryset должен подгружать author, tag и recipes__ingredient."""
+
+    queryset = queryset.order_by('id')
+    last_id = 0
+    while True:
+        recipes = list(queryset.filter(id__gt=last_id)[:chunk_size])
+        if not recipes:
+            return
+        for recipe in recipes:
+            yield json.dumps(export_recipe(recipe), ensure_ascii=False) + '\n'
+        last_id = recipes[-1].id
@@ -0,0 +1,78 @@
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import caches
+from recipes.models import DataVersion
+from recipes.signals import get_tag_version_name
+from rest_framework.response import Response
+
+
+class RecipeListCache:
+    """Кэш страниц списка рецептов для анонимных пользователей.
+
+    Ключ строится по хосту, отсортированным параметрам запроса, формату
+    ответа и версиям DataVersion, от которых зависит страница: при фильтре
+    по тэгам - версии этих тэгов, без фильтра - общая версия рецептов.
+    Изменение рецепта увеличивает версии только его тэгов, поэтому страницы
+    с другими тэгами остаются в кэше. Бэкенд задаётся алиасом
+    RECIPE_LIST_CACHE в CACHES.
+    """
+
+    prefix = 'recipe-list'
+    shared_version_names = ('tags', 'ingredients', 'users')
+
+    @property
+    def cache(self):
+        return caches[settings.RECIPE_LIST_CACHE]
+
+    def get_version_names(self, request):
+        tags = sorted(set(request.query_params.getlist('tags')))
+        names = [get_tag_version_name(slug) for slug in tags] or ['recipes']
+        return names + list(self.shared_version_names)
+
+    def get_key(self, request):
+        versions = DataVersion.objects.get_versions(
+            self.get_version_names(request)
+        )
+        key = json.dumps((
+            request.get_host(),
+            sorted(request.query_params.lists()),
+            request.accepted_renderer.format,
+            sorted(
+                (name, version) for name, (version, _) in versions.items()
+            ),
+        ))
+        return f'{self.prefix}:{hashlib.md5(key.encode()).hexdigest()}'
+
+    def get_response(self, request, handler, *args, **kwargs):
+        key = self.get_key(request)
+        data = self.cache.get(key)
+        if data is not None:
+            self.count('hits')
+            response = Response(data)
+            response['X-Cache'] = 'HIT'
+            return response
+        self.count('misses')
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            self.cache.set(key, response.data)
+        response['X-Cache'] = 'MISS'
+        return response
+
+    def count(self, name):
+        key = f'{self.prefix}:stats:{name}'
+        try:
+            self.cache.incr(key)
+        except ValueError:
+            self.cache.add(key, 0, timeout=None)
+            self.cache.incr(key)
+
+    def stats(self):
+        return {
+            name: self.cache.get(f'{self.prefix}:stats:{name}', 0)
+            for name in ('hits', 'misses')
+        }
+
+
+recipe_list_cache = RecipeListCache()
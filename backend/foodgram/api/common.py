@@ -1,55 +1,334 @@
-from recipes.models import IngredientRecipe, TagRecipe
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import BooleanField, Count, F, IntegerField, Window
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import RowNumber
+from recipes.models import (Favorite, IngredientRecipe, Recipe, ShoppingCart,
+                            TagRecipe)
+from recipes.search import index_recipes
+from recipes.signals import bump_recipe_versions, bump_tag_versions
 from rest_framework import status
 from rest_framework.response import Response
+from users.models import Follow
+
+FEED_SQL = '''
+SELECT recipe.id FROM {follow} follow
+CROSS JOIN LATERAL (
+    SELECT recipe.id, recipe.pub_date FROM {recipe} recipe
+    WHERE recipe.author_id = follow.author_id {seek}
+    ORDER BY recipe.pub_date DESC, recipe.id DESC
+    LIMIT %(limit)s
+) recipe
+WHERE follow.user_id = %(user_id)s
+ORDER BY recipe.pub_date DESC, recipe.id DESC
+LIMIT %(limit)s
+'''
+FEED_SEEK_SQL = 'AND (recipe.pub_date, recipe.id) < (%(pub_date)s, %(id)s)'
+# Пересечение с массивом ingredient_ids проверяется по GIN-индексу
+# recipe_ingredient_ids_idx, совпадения считаются в строке рецепта.
+INGREDIENTS_OVERLAP_SQL = '{ingredient_ids} && %s::integer[]'
+INGREDIENTS_MATCHED_SQL = (
+    'cardinality(ARRAY(SELECT unnest({ingredient_ids}) '
+    'INTERSECT SELECT unnest(%s::integer[])))'
+)
+
+
+class ViewerState:
+    """Состояние текущего пользователя в рамках одного запроса:
+    id рецептов в избранном и в списке покупок, id авторов в подписках.
+    Каждый набор загружается одним запросом при первом обращении."""
+
+    fields = {
+        Favorite: 'recipe',
+        ShoppingCart: 'recipe',
+        Follow: 'author',
+    }
+
+    def __init__(self, user):
+        self.user = user
+        self._ids = {}
+
+    def get_ids(self, model):
+        if model not in self._ids:
+            if self.user is None or self.user.is_anonymous:
+                self._ids[model] = frozenset()
+            else:
+                self._ids[model] = frozenset(
+                    model.objects.filter(user=self.user).values_list(
+                        self.fields[model], flat=True
+                    )
+                )
+        return self._ids[model]
+
+    def invalidate(self, model):
+        self._ids.pop(model, None)
+
+
+def get_viewer_state(request):
+    """Возвращает ViewerState, закреплённый за запросом."""
+
+    state = getattr(request, '_viewer_state', None)
+    if state is None:
+        state = ViewerState(getattr(request, 'user', None))
+        request._viewer_state = state
+    return state
 
 
 def add_del_obj_action(request, model, serializer, data):
     """Функция для добавления и удаления данных в модели Favorite,
-    Follow, ShoppingCart."""
+    Follow, ShoppingCart. Счётчики рецепта и суммы списка покупок
+    меняются сигналами в той же транзакции."""
 
     obj_exists = model.objects.filter(**data)
     if request.method == 'POST':
         serializer = serializer(data=data, context={'request': request})
         serializer.is_valid(raise_exception=True)
-        serializer.save()
+        with transaction.atomic():
+            serializer.save()
+        get_viewer_state(request).invalidate(model)
         return Response(
             serializer.data,
             status=status.HTTP_201_CREATED,
         )
-    obj_exists.delete()
+    with transaction.atomic():
+        obj_exists.delete()
+    get_viewer_state(request).invalidate(model)
     return Response(status=status.HTTP_204_NO_CONTENT)
 
 
 def get_is_field_action(request, model, data):
-    """Функция для фильтрации queryset по заданным параметрам."""
+    """Проверка, есть ли объект в Favorite, Follow или ShoppingCart
+    текущего пользователя, по данным ViewerState запроса."""
 
-    user = None
-    if request and hasattr(request, 'user'):
-        user = request.user
-    if not user:
+    if not request or not hasattr(request, 'user'):
         return False
-    data.update({'user': user.id})
-    return model.objects.filter(**data).exists()
+    field = ViewerState.fields[model]
+    return data[field] in get_viewer_state(request).get_ids(model)
 
 
-def create_update_instance_recipe(recipe, ingredients, tags):
+def get_ingredient_ids(ingredients):
+    """Значение Recipe.ingredient_ids для проверенных ингредиентов."""
+
+    return sorted(data['ingredient'].get('id').id for data in ingredients)
+
+
+def create_recipe_relations(items):
+    """Создаёт связи с ингредиентами и тэгами для последовательности
+    (рецепт, ингредиенты, тэги) двумя запросами bulk_create.
+    Recipe.ingredients_count и Recipe.ingredient_ids обновляются, если
+    они не были заданы заранее (get_ingredient_ids).
+    Здесь же, и только здесь, новые рецепты индексируются и
+    увеличивают версии: post_save при создании этого не делает."""
+
     obj_tag_recipe = []
     obj_ingredient_recipe = []
+    recipe_ids = []
+    recounted = []
 
-    for data in ingredients:
-        obj_ingredient_recipe.append(
-            IngredientRecipe(
-                recipe=recipe,
-                ingredient=data['ingredient'].get('id'),
-                amount=data.get('amount'),
+    for recipe, ingredients, tags in items:
+        recipe_ids.append(recipe.id)
+        ingredient_ids = get_ingredient_ids(ingredients)
+        if (
+            recipe.ingredients_count != len(ingredients)
+            or recipe.ingredient_ids != ingredient_ids
+        ):
+            recipe.ingredients_count = len(ingredients)
+            recipe.ingredient_ids = ingredient_ids
+            recounted.append(recipe)
+        for data in ingredients:
+            obj_ingredient_recipe.append(
+                IngredientRecipe(
+                    recipe=recipe,
+                    ingredient=data['ingredient'].get('id'),
+                    amount=data.get('amount'),
+                )
+            )
+        for tag in tags.values():
+            obj_tag_recipe.append(
+                TagRecipe(recipe=recipe, tag=tag)
             )
-        )
     IngredientRecipe.objects.bulk_create(obj_ingredient_recipe)
+    TagRecipe.objects.bulk_create(obj_tag_recipe)
+    Recipe.objects.bulk_update(
+        recounted, ['ingredients_count', 'ingredient_ids']
+    )
+    bump_recipe_versions(recipe_ids)
+    index_recipes(recipe_ids)
 
-    for tag in tags.values():
-        obj_tag_recipe.append(
-            TagRecipe(recipe=recipe, tag=tag)
+
+def create_update_instance_recipe(recipe, ingredients, tags):
+    create_recipe_relations(((recipe, ingredients, tags),))
+
+
+def update_recipe_ingredients(recipe, ingredients):
+    """Приводит ингредиенты рецепта к новым значениям, добавляя, изменяя
+    и удаляя только отличающиеся строки. Возвращает изменения количества
+    {id ингредиента: разница} для пересчёта списков покупок."""
+
+    current = {
+        item.ingredient_id: item
+        for item in IngredientRecipe.objects.filter(recipe=recipe)
+    }
+    delta = {}
+    to_create = []
+    to_update = []
+    for data in ingredients:
+        ingredient = data['ingredient'].get('id')
+        amount = data.get('amount')
+        item = current.pop(ingredient.id, None)
+        if item is None:
+            to_create.append(IngredientRecipe(
+                recipe=recipe, ingredient=ingredient, amount=amount
+            ))
+            delta[ingredient.id] = amount
+        elif item.amount != amount:
+            delta[ingredient.id] = amount - item.amount
+            item.amount = amount
+            to_update.append(item)
+    for ingredient_id, item in current.items():
+        delta[ingredient_id] = -item.amount
+
+    if current:
+        IngredientRecipe.objects.filter(
+            id__in=[item.id for item in current.values()]
+        ).delete()
+    IngredientRecipe.objects.bulk_create(to_create)
+    IngredientRecipe.objects.bulk_update(to_update, ['amount'])
+    recipe.ingredients_count = len(ingredients)
+    recipe.ingredient_ids = get_ingredient_ids(ingredients)
+    return delta
+
+
+def update_recipe_tags(recipe, tags):
+    """Приводит тэги рецепта к новым значениям. Возвращает id
+    удалённых тэгов."""
+
+    current_tags = set(TagRecipe.objects.filter(
+        recipe=recipe
+    ).values_list('tag_id', flat=True))
+    removed_tags = current_tags - tags.keys()
+    if removed_tags:
+        TagRecipe.objects.filter(
+            recipe=recipe, tag_id__in=removed_tags
+        ).delete()
+    TagRecipe.objects.bulk_create([
+        TagRecipe(recipe=recipe, tag=tags[tag_id])
+        for tag_id in tags.keys() - current_tags
+    ])
+    return removed_tags
+
+
+def update_recipe_relations(recipe, ingredients, tags):
+    """Обновляет ингредиенты и тэги рецепта перед его сохранением,
+    None - оставить как есть. Возвращает изменения количества
+    ингредиентов {id ингредиента: разница}.
+
+    Версии 'recipes' и текущих тэгов увеличиваются один раз при
+    сохранении рецепта (post_save), здесь - только версии удалённых
+    тэгов, на страницах которых рецепт больше не появится."""
+
+    if tags is not None:
+        bump_tag_versions(update_recipe_tags(recipe, tags))
+    if ingredients is None:
+        return {}
+    return update_recipe_ingredients(recipe, ingredients)
+
+
+def rank_by_ingredients(queryset, ingredient_ids):
+    """Рецепты, в которых есть хотя бы один ингредиент из ingredient_ids:
+    сначала те, для которых есть все ингредиенты, затем по числу
+    недостающих (missing_count).
+
+    В PostgreSQL кандидаты выбираются по GIN-индексу массива
+    Recipe.ingredient_ids, без соединения с IngredientRecipe и
+    группировки. В остальных СУБД совпадения считаются по индексу
+    ingredient_recipe_idx (ингредиент -> рецепты) только для переданных
+    ингредиентов. Общее число ингредиентов рецепта хранится
+    в Recipe.ingredients_count.
+    """
+
+    ingredient_ids = sorted(ingredient_ids)
+    if connection.vendor == 'postgresql':
+        column = '{}.{}'.format(
+            connection.ops.quote_name(Recipe._meta.db_table),
+            connection.ops.quote_name('ingredient_ids'),
         )
-    TagRecipe.objects.bulk_create(obj_tag_recipe)
+        queryset = queryset.annotate(
+            has_ingredients=RawSQL(
+                INGREDIENTS_OVERLAP_SQL.format(ingredient_ids=column),
+                (ingredient_ids,),
+                output_field=BooleanField(),
+            ),
+        ).filter(has_ingredients=True).annotate(
+            matched_count=RawSQL(
+                INGREDIENTS_MATCHED_SQL.format(ingredient_ids=column),
+                (ingredient_ids,),
+                output_field=IntegerField(),
+            ),
+        )
+    else:
+        queryset = queryset.filter(
+            recipes__ingredient__in=ingredient_ids
+        ).annotate(
+            matched_count=Count('recipes', distinct=True),
+        )
+    return queryset.annotate(
+        missing_count=F('ingredients_count') - F('matched_count'),
+    ).order_by('missing_count', '-pub_date', '-id')
+
+
+def get_recipes_limit(request):
+    """Значение параметра recipes_limit, ограниченное
+    SUBSCRIPTION_RECIPES_LIMIT (он же значение по умолчанию)."""
+
+    try:
+        limit = int(request.query_params['recipes_limit'])
+    except (AttributeError, KeyError, ValueError):
+        return settings.SUBSCRIPTION_RECIPES_LIMIT
+    return max(0, min(limit, settings.SUBSCRIPTION_RECIPES_LIMIT))
+
+
+def prefetch_latest_recipes(authors, limit):
+    """Записывает в author.latest_recipes последние limit рецептов
+    каждого автора. Все рецепты выбираются одним запросом
+    с оконной функцией ROW_NUMBER по автору."""
+
+    latest = {author.id: [] for author in authors}
+    if latest and limit:
+        ranked = Recipe.objects.filter(author__in=latest).annotate(
+            recipe_rank=Window(
+                RowNumber(),
+                partition_by=[F('author')],
+                order_by=[F('pub_date').desc(), F('id').desc()],
+            )
+        ).order_by()
+        sql, params = ranked.query.sql_with_params()
+        for recipe in Recipe.objects.raw(
+            f'SELECT * FROM ({sql}) ranked WHERE recipe_rank <= %s '
+            f'ORDER BY author_id, recipe_rank',
+            (*params, limit),
+        ):
+            latest[recipe.author_id].append(recipe)
+    for author in authors:
+        author.latest_recipes = latest[author.id]
+
+
+def get_feed_recipe_ids(user_id, position, limit):
+    """id последних limit рецептов авторов из подписок пользователя,
+    опубликованных раньше position = (pub_date, id). Только PostgreSQL:
+    используется LATERAL-подзапрос по каждому автору."""
 
-    return
+    quote = connection.ops.quote_name
+    params = {'user_id': user_id, 'limit': limit}
+    seek = ''
+    if position is not None:
+        params['pub_date'], params['id'] = position
+        seek = FEED_SEEK_SQL
+    sql = FEED_SQL.format(
+        follow=quote(Follow._meta.db_table),
+        recipe=quote(Recipe._meta.db_table),
+        seek=seek,
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
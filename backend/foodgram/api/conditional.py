@@ -0,0 +1,76 @@
+from calendar import timegm
+
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+from recipes.models import DataVersion
+from recipes.signals import get_user_version_name
+
+
+class ConditionalGetMixin:
+    """Поддержка ETag и Last-Modified для действий conditional_actions.
+
+    Значения заголовков строятся по счётчикам DataVersion из version_names,
+    поэтому ответ 304 Not Modified отдаётся без обращения к сериализаторам.
+    При user_versioned = True в версию входит состояние текущего
+    пользователя (избранное, список покупок, подписки).
+    Для retrieve объект загружается до сравнения валидаторов,
+    чтобы для несуществующего объекта вернуть 404, а не 304.
+    """
+
+    conditional_actions = ('list', 'retrieve')
+    version_names = ()
+    user_versioned = False
+
+    def get_version_names(self):
+        names = list(self.version_names)
+        if self.user_versioned and self.request.user.is_authenticated:
+            names.append(get_user_version_name(self.request.user.id))
+        return names
+
+    def get_validators(self):
+        versions = DataVersion.objects.get_versions(self.get_version_names())
+        etag = quote_etag('{}.{}'.format(
+            self.request.accepted_renderer.format,
+            '.'.join(str(version) for version, _ in versions.values()),
+        ))
+        modified = [
+            modified for _, modified in versions.values() if modified
+        ]
+        last_modified = (
+            timegm(max(modified).utctimetuple()) if modified else None
+        )
+        return etag, last_modified
+
+    def conditional_response(self, handler, request, *args, **kwargs):
+        if self.action not in self.conditional_actions:
+            return handler(request, *args, **kwargs)
+        if self.action == 'retrieve':
+            self.get_object()
+        etag, last_modified = self.get_validators()
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            response = handler(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            if last_modified:
+                response['Last-Modified'] = http_date(last_modified)
+            if self.user_versioned:
+                patch_vary_headers(response, ('Authorization',))
+        return response
+
+    def get_object(self):
+        if not hasattr(self, '_object'):
+            self._object = super().get_object()
+        return self._object
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(
+            super().list, request, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(
+            super().retrieve, request, *args, **kwargs
+        )
@@ -0,0 +1,161 @@
+import logging
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.signals import request_finished, request_started
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from django.db.models import Max
+from django.dispatch import receiver
+from django.utils import timezone
+from recipes.models import DataVersion
+from rest_framework.permissions import SAFE_METHODS
+
+from .metrics import registry
+
+logger = logging.getLogger(__name__)
+
+STICKY_COOKIE = 'db_primary'
+
+_local = threading.local()
+_replica_checks = {}
+
+
+@receiver(request_finished)
+def mark_connections_used(**kwargs):
+    """После запроса запоминает время последнего использования
+    открытых соединений."""
+
+    now = time.monotonic()
+    for connection in connections.all():
+        if connection.connection is not None:
+            connection.last_used_at = now
+
+
+@receiver(request_started)
+def check_connections(**kwargs):
+    """Перед запросом проверяет постоянные соединения, простоявшие
+    дольше DB_HEALTH_CHECK_INTERVAL секунд: сервер БД или пулер мог
+    закрыть их по таймауту. Неработающее соединение закрывается,
+    Django откроет новое при первом обращении к БД."""
+
+    now = time.monotonic()
+    for connection in connections.all():
+        if connection.connection is None or connection.in_atomic_block:
+            continue
+        idle = now - getattr(connection, 'last_used_at', now)
+        if idle < settings.DB_HEALTH_CHECK_INTERVAL:
+            continue
+        if not connection.is_usable():
+            connection.close()
+            registry.record_recycled(connection.alias)
+
+
+def check_replica(alias):
+    """Реплика не отстаёт, если в ней есть последнее изменение
+    DataVersion основной БД. Иначе отставание считается от последнего
+    изменения, которое реплика уже получила: пока оно моложе
+    REPLICA_MAX_LAG секунд, реплика считается свежей. Недоступная
+    реплика и реплика без изменений считаются отстающими."""
+
+    try:
+        primary = DataVersion.objects.using(DEFAULT_DB_ALIAS).aggregate(
+            modified=Max('modified')
+        )['modified']
+        replica = DataVersion.objects.using(alias).aggregate(
+            modified=Max('modified')
+        )['modified']
+    except DatabaseError as error:
+        logger.warning('Реплика %s недоступна: %s', alias, error)
+        return False
+    if primary is None or (replica is not None and replica >= primary):
+        return True
+    if replica is None:
+        logger.warning('Реплика %s не получила ни одного изменения', alias)
+        return False
+    lag = (timezone.now() - replica).total_seconds()
+    if lag > settings.REPLICA_MAX_LAG:
+        logger.warning('Реплика %s отстаёт больше %.1f с', alias, lag)
+        return False
+    return True
+
+
+def is_replica_fresh(alias):
+    """Результат check_replica, который перепроверяется не чаще
+    раза в REPLICA_LAG_CHECK_INTERVAL секунд."""
+
+    now = time.monotonic()
+    checked_at, fresh = _replica_checks.get(alias, (None, False))
+    if (
+        checked_at is None
+        or now - checked_at >= settings.REPLICA_LAG_CHECK_INTERVAL
+    ):
+        fresh = check_replica(alias)
+        _replica_checks[alias] = (now, fresh)
+    return fresh
+
+
+class ReplicaRouter:
+    """Чтение в запросах, которые ReplicaMiddleware пометила как
+    безопасные, идёт на случайную неотстающую реплику из
+    REPLICA_DATABASES. Всё остальное, включая запись, команды
+    управления и чтение при отставании всех реплик, - в основную БД."""
+
+    def db_for_read(self, model, **hints):
+        if not getattr(_local, 'use_replica', False):
+            return DEFAULT_DB_ALIAS
+        replicas = [
+            alias for alias in settings.REPLICA_DATABASES
+            if is_replica_fresh(alias)
+        ]
+        if not replicas:
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.REPLICA_DATABASES}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+class ReplicaMiddleware:
+    """Разрешает чтение с реплик для GET, HEAD и OPTIONS.
+
+    Успешный изменяющий запрос (избранное, список покупок, подписка,
+    рецепты) ставит cookie STICKY_COOKIE на REPLICA_STICKY_SECONDS:
+    пока она есть, запросы пользователя читают основную БД и видят
+    свои изменения, даже если реплика ещё их не получила.
+    """
+
+    def __init__(self, get_response):
+        if not settings.REPLICA_DATABASES:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        _local.use_replica = (
+            request.method in SAFE_METHODS
+            and STICKY_COOKIE not in request.COOKIES
+        )
+        try:
+            response = self.get_response(request)
+        finally:
+            _local.use_replica = False
+        if (
+            request.method not in SAFE_METHODS
+            and 200 <= response.status_code < 300
+        ):
+            response.set_cookie(
+                STICKY_COOKIE,
+                '1',
+                max_age=settings.REPLICA_STICKY_SECONDS,
+                httponly=True,
+                samesite='Lax',
+            )
+        return response
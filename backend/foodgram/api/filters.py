@@ -1,21 +1,38 @@
 from django_filters import rest_framework
 from recipes.models import Ingredient, Recipe, Tag
+from recipes.search import search_recipes
 
 
 class RecipeAnonymousFilters(rest_framework.FilterSet):
-    """Воможность фильтровать рецепты только по тэгу
-    для анонимных пользователей."""
+    """Воможность фильтровать рецепты только по тэгу, искать по тексту
+    и сортировать по популярности для анонимных пользователей."""
 
     tags = rest_framework.ModelMultipleChoiceFilter(
         field_name='tag__slug',
         queryset=Tag.objects.all(),
         to_field_name='slug',
     )
+    search = rest_framework.CharFilter(method='get_search_queryset')
+    ordering = rest_framework.ChoiceFilter(
+        choices=(('popular', 'popular'),),
+        method='get_ordering_queryset',
+    )
 
     class Meta:
         model = Recipe
         fields = ('tags',)
 
+    def get_search_queryset(self, queryset, field_name, value):
+        return search_recipes(queryset, value)
+
+    def get_ordering_queryset(self, queryset, field_name, value):
+        """Популярные: по числу добавлений в избранное, затем в списки
+        покупок. Порядок совпадает с индексом recipe_popular_idx."""
+
+        return queryset.order_by(
+            '-favorites_count', '-carts_count', '-pub_date', '-id'
+        )
+
 
 class RecipeFilters(RecipeAnonymousFilters):
     """Фильтрация рецептов для авторизованных пользователей."""
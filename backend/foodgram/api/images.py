@@ -0,0 +1,110 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from PIL import Image
+from recipes.models import Recipe
+
+logger = logging.getLogger(__name__)
+
+RENDITION_EXTENSIONS = {'WEBP': 'webp', 'JPEG': 'jpg'}
+
+
+def get_rendition_name(name, rendition):
+    """Путь уменьшенной копии изображения name."""
+
+    directory, filename = os.path.split(name)
+    base, _ = os.path.splitext(filename)
+    extension = RENDITION_EXTENSIONS[settings.RECIPE_IMAGE_RENDITION_FORMAT]
+    return os.path.join(
+        directory, 'renditions', f'{base}_{rendition}.{extension}'
+    )
+
+
+def get_renditions_key():
+    """Набор копий, которые создаёт make_renditions при текущих
+    настройках. Хранится в Recipe.image_renditions."""
+
+    return ','.join((
+        settings.RECIPE_IMAGE_RENDITION_FORMAT,
+        *sorted(settings.RECIPE_IMAGE_RENDITIONS),
+    ))
+
+
+def touch_stored_file(storage, name):
+    """Обновляет время изменения файла name, чтобы collect_media_garbage
+    не удалил его в течение --min-age. False, если файла нет."""
+
+    try:
+        os.utime(storage.path(name))
+    except NotImplementedError:
+        return storage.exists(name)
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def make_renditions(name):
+    """Создаёт уменьшенные копии изображения для всех размеров
+    из RECIPE_IMAGE_RENDITIONS, уже существующие пропускаются."""
+
+    image_format = settings.RECIPE_IMAGE_RENDITION_FORMAT
+    with default_storage.open(name) as file:
+        image = Image.open(file)
+        image.load()
+    if image_format == 'JPEG' and image.mode != 'RGB':
+        image = image.convert('RGB')
+    for rendition, size in settings.RECIPE_IMAGE_RENDITIONS.items():
+        rendition_name = get_rendition_name(name, rendition)
+        if default_storage.exists(rendition_name):
+            continue
+        resized = image.copy()
+        resized.thumbnail(size, Image.LANCZOS)
+        buffer = BytesIO()
+        resized.save(buffer, image_format, quality=85)
+        default_storage.save(rendition_name, ContentFile(buffer.getvalue()))
+
+
+def mark_renditions(names):
+    """Отмечает копии изображений names созданными у всех рецептов
+    с этими изображениями."""
+
+    Recipe.objects.filter(image__in=names).update(
+        image_renditions=get_renditions_key()
+    )
+
+
+def _make_renditions_logged(name):
+    try:
+        make_renditions(name)
+        mark_renditions((name,))
+    except Exception:
+        logger.exception('Не удалось создать копии изображения %s', name)
+    finally:
+        connection.close()
+
+
+@lru_cache(maxsize=None)
+def get_executor():
+    return ThreadPoolExecutor(
+        max_workers=settings.RECIPE_IMAGE_WORKERS,
+        thread_name_prefix='recipe-images',
+    )
+
+
+def schedule_renditions(image):
+    """Ставит создание уменьшенных копий в фоновый пул
+    после фиксации текущей транзакции."""
+
+    if not image:
+        return
+    name = image.name
+    transaction.on_commit(
+        lambda: get_executor().submit(_make_renditions_logged, name)
+    )
@@ -0,0 +1,71 @@
+import threading
+from bisect import bisect_left
+
+from recipes.models import DataVersion, Ingredient
+
+
+class IngredientIndex:
+    """Индекс названий ингредиентов в памяти процесса для автодополнения.
+
+    Названия хранятся отсортированными в нижнем регистре, поиск по префиксу
+    выполняется через bisect. Индекс строится при первом запросе и
+    перестраивается, когда меняется версия DataVersion 'ingredients'
+    (в том числе после изменений в других процессах).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = (None, [], [])
+
+    def _get_entries(self):
+        version, _ = DataVersion.objects.get_versions(
+            ['ingredients']
+        )['ingredients']
+        if self._entries[0] == version:
+            return self._entries[1:]
+        with self._lock:
+            if self._entries[0] != version:
+                ingredients = sorted(
+                    (
+                        Ingredient(id=pk, name=name, measurement_unit=unit)
+                        for pk, name, unit in Ingredient.objects.values_list(
+                            'id', 'name', 'measurement_unit'
+                        )
+                    ),
+                    key=lambda ingredient: (
+                        ingredient.name.lower(), ingredient.id
+                    ),
+                )
+                keys = [ingredient.name.lower() for ingredient in ingredients]
+                self._entries = (version, keys, ingredients)
+            return self._entries[1:]
+
+    def search(self, name, measurement_unit=None, limit=None):
+        """Ингредиенты, название которых начинается с name, затем те,
+        в названии которых name встречается в другом месте."""
+
+        keys, ingredients = self._get_entries()
+        name = name.lower()
+        start = bisect_left(keys, name)
+        end = bisect_left(keys, name + '\uffff', lo=start)
+        found = []
+        for index in range(start, end):
+            if len(found) == limit:
+                return found
+            if measurement_unit in (None, ingredients[index].measurement_unit):
+                found.append(ingredients[index])
+        for index, key in enumerate(keys):
+            if len(found) == limit:
+                break
+            if (
+                name in key[1:]
+                and not key.startswith(name)
+                and measurement_unit in (
+                    None, ingredients[index].measurement_unit
+                )
+            ):
+                found.append(ingredients[index])
+        return found
+
+
+ingredient_index = IngredientIndex()
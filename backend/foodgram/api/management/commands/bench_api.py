@@ -0,0 +1,437 @@
+import gc
+import json
+import math
+import platform
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+
+import django
+from api.management.commands.generate_data import PASSWORD, USERNAME_PREFIX
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+User = get_user_model()
+
+API_PREFIX = '/api'
+IMPORT_RECIPE_NAME = 'Рецепт из замера импорта'
+
+
+def percentile(values, fraction):
+    """Перцентиль по ближайшему рангу для отсортированного списка."""
+
+    return values[max(math.ceil(fraction * len(values)) - 1, 0)]
+
+
+class Benchmark:
+    """Состояние замера: клиенты, объекты для запросов и замеры
+    по каждой метке маршрута."""
+
+    def __init__(self, user, admin):
+        self.user = user
+        self.admin_user = admin
+        self.anonymous = APIClient()
+        self.client = APIClient()
+        token, _ = Token.objects.get_or_create(user=user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.admin = APIClient()
+        self.admin.force_authenticate(admin)
+        self.recipe = Recipe.objects.order_by('-id').first()
+        self.author = self.recipe.author
+        self.tags = list(Tag.objects.values_list('slug', flat=True)[:2])
+        self.ingredients = list(Ingredient.objects.order_by('id')[:3])
+        self.free_recipe = Recipe.objects.exclude(
+            favorites__user=user
+        ).exclude(shoppings__user=user).order_by('id').first()
+        self.free_author = User.objects.exclude(
+            followings__user=user
+        ).exclude(id=user.id).order_by('id').first()
+        self.timings = defaultdict(list)
+        self.queries = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def call(self, label, method, path, client=None, **kwargs):
+        client = client or self.client
+        with CaptureQueriesContext(connection) as context:
+            started = time.perf_counter()
+            response = getattr(client, method)(API_PREFIX + path, **kwargs)
+            if response.streaming:
+                b''.join(response.streaming_content)
+            elapsed = time.perf_counter() - started
+        self.timings[label].append(elapsed)
+        self.queries[label].append(len(context.captured_queries))
+        if response.status_code >= 400:
+            self.errors[label] += 1
+        return response
+
+    def reset(self):
+        self.timings.clear()
+        self.queries.clear()
+        self.errors.clear()
+
+    def get_recipe_payload(self):
+        return {
+            'name': 'Рецепт из замера',
+            'text': 'Описание',
+            'cooking_time': 10,
+            'tags': list(Tag.objects.values_list('id', flat=True)[:2]),
+            'ingredients': [
+                {'id': ingredient.id, 'amount': 10}
+                for ingredient in self.ingredients
+            ],
+        }
+
+    def get_import_payload(self):
+        return json.dumps({
+            'name': IMPORT_RECIPE_NAME,
+            'text': 'Описание',
+            'cooking_time': 10,
+            'tags': self.tags,
+            'ingredients': [
+                {
+                    'name': ingredient.name,
+                    'measurement_unit': ingredient.measurement_unit,
+                    'amount': 10,
+                }
+                for ingredient in self.ingredients
+            ],
+        }, ensure_ascii=False) + '\n'
+
+    def get_stats(self, label):
+        timings = sorted(self.timings[label])
+        total = sum(timings)
+        return {
+            'requests': len(timings),
+            'errors': self.errors[label],
+            'p50_ms': round(percentile(timings, 0.5) * 1000, 3),
+            'p95_ms': round(percentile(timings, 0.95) * 1000, 3),
+            'p99_ms': round(percentile(timings, 0.99) * 1000, 3),
+            'mean_ms': round(total / len(timings) * 1000, 3),
+            'queries': max(self.queries[label]),
+            'rps': round(len(timings) / total, 1) if total else None,
+        }
+
+
+def users_routes(bench):
+    bench.call('users-list', 'get', '/users/')
+    bench.call('users-me', 'get', '/users/me/')
+    bench.call('users-detail', 'get', f'/users/{bench.author.id}/')
+    bench.call('users-subscriptions', 'get', '/users/subscriptions/')
+
+
+def subscribe_routes(bench):
+    if bench.free_author is None:
+        return
+    path = f'/users/{bench.free_author.id}/subscribe/'
+    bench.call('users-subscribe-post', 'post', path)
+    bench.call('users-subscribe-delete', 'delete', path)
+
+
+def auth_routes(bench):
+    """Вход и выход администратора: выход удаляет токен, поэтому
+    токен основного пользователя не используется."""
+
+    response = bench.call(
+        'auth-token-login',
+        'post',
+        '/auth/token/login/',
+        client=bench.anonymous,
+        data={'email': bench.admin_user.email, 'password': PASSWORD},
+    )
+    client = APIClient()
+    client.credentials(
+        HTTP_AUTHORIZATION=f'Token {response.data.get("auth_token")}'
+    )
+    bench.call('auth-token-logout', 'post', '/auth/token/logout/', client)
+
+
+def catalog_routes(bench):
+    bench.call('tags-list', 'get', '/tags/')
+    bench.call('ingredients-list', 'get', '/ingredients/')
+    bench.call(
+        'ingredients-search',
+        'get',
+        '/ingredients/',
+        data={'name': bench.ingredients[0].name[:3]},
+    )
+
+
+def recipe_list_routes(bench):
+    bench.call('recipes-list-anonymous', 'get', '/recipes/', bench.anonymous)
+    bench.call('recipes-list', 'get', '/recipes/')
+    bench.call('recipes-list-tags', 'get', '/recipes/', data={
+        'tags': bench.tags,
+    })
+    bench.call('recipes-list-author', 'get', '/recipes/', data={
+        'author': bench.author.id,
+    })
+    bench.call('recipes-list-favorited', 'get', '/recipes/', data={
+        'is_favorited': 1,
+    })
+    bench.call('recipes-list-in-cart', 'get', '/recipes/', data={
+        'is_in_shopping_cart': 1,
+    })
+    bench.call('recipes-list-search', 'get', '/recipes/', data={
+        'search': bench.recipe.name.split()[0],
+    })
+    bench.call('recipes-list-popular', 'get', '/recipes/', data={
+        'ordering': 'popular',
+    })
+    response = bench.call('recipes-list-cursor', 'get', '/recipes/', data={
+        'cursor': '',
+    })
+    cursor = (response.data or {}).get('next')
+    if cursor:
+        bench.call(
+            'recipes-list-cursor-next', 'get', cursor.split(API_PREFIX, 1)[1]
+        )
+
+
+def recipe_detail_routes(bench):
+    bench.call('recipes-detail', 'get', f'/recipes/{bench.recipe.id}/')
+    bench.call(
+        'recipes-detail-anonymous',
+        'get',
+        f'/recipes/{bench.recipe.id}/',
+        bench.anonymous,
+    )
+
+
+def recipe_write_routes(bench):
+    payload = bench.get_recipe_payload()
+    response = bench.call(
+        'recipes-create', 'post', '/recipes/', data=payload, format='json'
+    )
+    if response.status_code != 201:
+        return
+    path = f'/recipes/{response.data["id"]}/'
+    payload['ingredients'] = payload['ingredients'][:-1]
+    payload['name'] = 'Рецепт из замера, изменённый'
+    bench.call('recipes-update', 'patch', path, data=payload, format='json')
+    bench.call('recipes-delete', 'delete', path)
+
+
+def favorite_cart_routes(bench):
+    if bench.free_recipe is None:
+        return
+    for name in ('favorite', 'shopping_cart'):
+        path = f'/recipes/{bench.free_recipe.id}/{name}/'
+        bench.call(f'recipes-{name}-post', 'post', path)
+        bench.call(f'recipes-{name}-delete', 'delete', path)
+
+
+def shopping_list_routes(bench):
+    for file_format in ('txt', 'csv', 'json', 'pdf'):
+        bench.call(
+            f'recipes-download-shopping-cart-{file_format}',
+            'get',
+            '/recipes/download_shopping_cart/',
+            data={'type': file_format},
+        )
+
+
+def recipe_action_routes(bench):
+    bench.call('recipes-feed', 'get', '/recipes/feed/')
+    bench.call(
+        'recipes-by-ingredients',
+        'get',
+        '/recipes/by-ingredients/',
+        data={'ingredients': ','.join(
+            str(ingredient.id) for ingredient in bench.ingredients
+        )},
+    )
+    bench.call(
+        'recipes-export',
+        'get',
+        '/recipes/export/',
+        bench.admin,
+        data={'author': bench.author.id},
+    )
+    bench.call(
+        'recipes-cache-stats', 'get', '/recipes/cache_stats/', bench.admin
+    )
+
+
+def import_routes(bench):
+    bench.call(
+        'recipes-import',
+        'post',
+        '/recipes/import/',
+        bench.admin,
+        data=bench.get_import_payload(),
+        content_type='application/x-ndjson',
+    )
+    Recipe.objects.filter(
+        author=bench.admin_user, name=IMPORT_RECIPE_NAME
+    ).delete()
+
+
+def metrics_routes(bench):
+    if settings.API_METRICS_ENABLED:
+        bench.call('metrics', 'get', '/metrics/', bench.anonymous)
+
+
+ROUTES = {
+    'users': users_routes,
+    'subscribe': subscribe_routes,
+    'auth': auth_routes,
+    'catalog': catalog_routes,
+    'recipe-list': recipe_list_routes,
+    'recipe-detail': recipe_detail_routes,
+    'recipe-write': recipe_write_routes,
+    'favorite-cart': favorite_cart_routes,
+    'shopping-list': shopping_list_routes,
+    'recipe-actions': recipe_action_routes,
+    'import': import_routes,
+    'metrics': metrics_routes,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочный замер маршрутов API на данных generate_data: '
+        'p50/p95/p99, число SQL-запросов и пропускная способность. '
+        'Изменения данных откатываются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument(
+            '--routes',
+            nargs='+',
+            choices=sorted(ROUTES),
+            default=sorted(ROUTES),
+        )
+        parser.add_argument('--output', help='Сохранить результат в JSON')
+        parser.add_argument(
+            '--baseline', help='JSON предыдущего замера для сравнения'
+        )
+        parser.add_argument(
+            '--max-regression',
+            type=float,
+            default=0.25,
+            help='Допустимый относительный рост p95',
+        )
+        parser.add_argument(
+            '--min-delta-ms',
+            type=float,
+            default=1.0,
+            help='Рост p95 меньше этого значения не считается регрессией',
+        )
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(
+            username__startswith=USERNAME_PREFIX
+        ).order_by('id').first()
+        if user is None or not Recipe.objects.exists():
+            raise CommandError(
+                'Нет данных для замера, сначала выполните generate_data'
+            )
+        with transaction.atomic():
+            result = self.run(user, options)
+            transaction.set_rollback(True)
+        self.report(result['routes'])
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf8') as file:
+                json.dump(result, file, ensure_ascii=False, indent=2)
+        if options['baseline']:
+            self.compare(result['routes'], options)
+
+    def run(self, user, options):
+        admin = User.objects.create(
+            username='bench_api_admin',
+            email='bench_api_admin@example.com',
+            password=make_password(PASSWORD),
+            is_staff=True,
+        )
+        bench = Benchmark(user, admin)
+        routes = [ROUTES[name] for name in options['routes']]
+        for _ in range(options['warmup']):
+            for route in routes:
+                route(bench)
+        bench.reset()
+        # Объекты, созданные до замера, не просматриваются сборщиком
+        # мусора: иначе полная сборка на десятки миллисекунд попадает
+        # в случайный маршрут и даёт ложную регрессию p95.
+        gc.collect()
+        gc.freeze()
+        started = time.perf_counter()
+        try:
+            for _ in range(options['requests']):
+                for route in routes:
+                    route(bench)
+        finally:
+            gc.unfreeze()
+        elapsed = time.perf_counter() - started
+        total = sum(len(timings) for timings in bench.timings.values())
+        return {
+            'meta': {
+                'created': datetime.now(timezone.utc).isoformat(),
+                'vendor': connection.vendor,
+                'django': django.get_version(),
+                'python': platform.python_version(),
+                'users': User.objects.count(),
+                'recipes': Recipe.objects.count(),
+                'favorites': Favorite.objects.count(),
+                'carts': ShoppingCart.objects.count(),
+                'iterations': options['requests'],
+                'total_requests': total,
+                'rps': round(total / elapsed, 1),
+            },
+            'routes': {
+                label: bench.get_stats(label)
+                for label in sorted(bench.timings)
+            },
+        }
+
+    def report(self, routes):
+        self.stdout.write(
+            f'{"маршрут":<40}{"p50":>9}{"p95":>9}{"p99":>9}'
+            f'{"SQL":>6}{"rps":>9}{"ошибок":>8}'
+        )
+        for label, stats in routes.items():
+            self.stdout.write(
+                f'{label:<40}{stats["p50_ms"]:>9.2f}{stats["p95_ms"]:>9.2f}'
+                f'{stats["p99_ms"]:>9.2f}{stats["queries"]:>6}'
+                f'{stats["rps"] or 0:>9.1f}{stats["errors"]:>8}'
+            )
+
+    def compare(self, routes, options):
+        """Регрессия - рост p95 больше допустимого, новые ошибки
+        или рост числа SQL-запросов."""
+
+        with open(options['baseline'], encoding='utf8') as file:
+            baseline = json.load(file)['routes']
+        failures = []
+        for label, stats in routes.items():
+            base = baseline.get(label)
+            if base is None:
+                continue
+            delta = stats['p95_ms'] - base['p95_ms']
+            if (
+                delta > options['min_delta_ms']
+                and delta > base['p95_ms'] * options['max_regression']
+            ):
+                failures.append(
+                    f'{label}: p95 {base["p95_ms"]} -> {stats["p95_ms"]} мс'
+                )
+            if stats['queries'] > base['queries']:
+                failures.append(
+                    f'{label}: SQL-запросов {base["queries"]} -> '
+                    f'{stats["queries"]}'
+                )
+            if stats['errors'] > base['errors']:
+                failures.append(
+                    f'{label}: ошибок {base["errors"]} -> {stats["errors"]}'
+                )
+        if failures:
+            raise CommandError('Регрессия:\n' + '\n'.join(failures))
+        self.stdout.write(self.style.SUCCESS('Регрессий нет'))
@@ -0,0 +1,166 @@
+import asyncio
+import json
+import math
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+DEFAULT_PATHS = (
+    '/api/tags/',
+    '/api/ingredients/',
+    '/api/recipes/',
+    '/api/recipes/?limit=20',
+)
+
+
+def percentile(values, fraction):
+    return values[max(math.ceil(fraction * len(values)) - 1, 0)]
+
+
+def build_request(host, path, token):
+    headers = [
+        f'GET {path} HTTP/1.1',
+        f'Host: {host}',
+        'Accept: application/json',
+        'Connection: close',
+    ]
+    if token:
+        headers.append(f'Authorization: Token {token}')
+    return ('\r\n'.join(headers) + '\r\n\r\n').encode('latin1')
+
+
+async def fetch(host, port, request):
+    """Статус ответа. Ответ читается до закрытия соединения."""
+
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        writer.write(request)
+        await writer.drain()
+        response = await reader.read()
+    finally:
+        writer.close()
+    return int(response.split(b' ', 2)[1])
+
+
+async def slow_client(host, port, request, delay, stop):
+    """Медленный клиент: отправляет половину запроса и ждёт delay
+    секунд, пока сервер держит для него соединение открытым."""
+
+    middle = len(request) // 2
+    while not stop.is_set():
+        try:
+            reader, writer = await asyncio.open_connection(host, port)
+            writer.write(request[:middle])
+            await writer.drain()
+            await asyncio.sleep(delay)
+            writer.write(request[middle:])
+            await writer.drain()
+            await reader.read()
+            writer.close()
+        except OSError:
+            await asyncio.sleep(delay)
+
+
+async def run_load(url, options):
+    parts = urlsplit(url)
+    host, port = parts.hostname, parts.port or 80
+    requests = [
+        build_request(parts.netloc, path, options['token'])
+        for path in options['paths']
+    ]
+    stop = asyncio.Event()
+    slow = [
+        asyncio.ensure_future(slow_client(
+            host, port, requests[0], options['slow_seconds'], stop
+        ))
+        for _ in range(options['slow_clients'])
+    ]
+    timings = []
+    errors = 0
+    counter = iter(range(options['requests']))
+
+    async def worker():
+        nonlocal errors
+        for index in counter:
+            started = time.perf_counter()
+            try:
+                status = await fetch(
+                    host, port, requests[index % len(requests)]
+                )
+            except (OSError, IndexError, ValueError):
+                status = None
+            timings.append(time.perf_counter() - started)
+            if status is None or status >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        worker() for _ in range(options['concurrency'])
+    ))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    for task in slow:
+        task.cancel()
+    await asyncio.gather(*slow, return_exceptions=True)
+    timings.sort()
+    return {
+        'requests': len(timings),
+        'errors': errors,
+        'rps': round(len(timings) / elapsed, 1),
+        'p50_ms': round(percentile(timings, 0.5) * 1000, 3),
+        'p95_ms': round(percentile(timings, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(timings, 0.99) * 1000, 3),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнение пропускной способности запущенных серверов, например '
+        'gunicorn в режиме WSGI и ASGI, при большом числе одновременных '
+        'запросов к эндпоинтам чтения. Пример: bench_concurrency '
+        'wsgi=http://127.0.0.1:8000 asgi=http://127.0.0.1:8001'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'targets', nargs='+', help='Серверы в виде имя=http://хост:порт'
+        )
+        parser.add_argument('--paths', nargs='+', default=DEFAULT_PATHS)
+        parser.add_argument('--concurrency', type=int, default=64)
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument(
+            '--slow-clients',
+            type=int,
+            default=0,
+            help='Число медленных клиентов во время замера',
+        )
+        parser.add_argument('--slow-seconds', type=float, default=2.0)
+        parser.add_argument(
+            '--token', help='Токен для эндпоинтов, требующих авторизации'
+        )
+        parser.add_argument('--output', help='Сохранить результат в JSON')
+
+    def handle(self, *args, **options):
+        results = {}
+        for target in options['targets']:
+            name, separator, url = target.partition('=')
+            if not separator or not url.startswith('http://'):
+                raise CommandError(
+                    f'Ожидается имя=http://хост:порт, получено {target}'
+                )
+            results[name] = asyncio.run(run_load(url, options))
+            stats = results[name]
+            self.stdout.write(
+                f'{name}: {stats["rps"]} запросов/с, '
+                f'p50 {stats["p50_ms"]} мс, p95 {stats["p95_ms"]} мс, '
+                f'p99 {stats["p99_ms"]} мс, ошибок {stats["errors"]}'
+            )
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf8') as file:
+                json.dump({
+                    'concurrency': options['concurrency'],
+                    'slow_clients': options['slow_clients'],
+                    'paths': list(options['paths']),
+                    'targets': results,
+                }, file, ensure_ascii=False, indent=2)
@@ -0,0 +1,179 @@
+import itertools
+import random
+import statistics
+import time
+
+from api.bulk import bulk_create_recipes
+from api.common import rank_by_ingredients
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, F, Q
+from recipes.models import Ingredient, IngredientRecipe, Recipe
+
+User = get_user_model()
+
+POPULATE_CHUNK_SIZE = 10000
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнение поиска рецептов по имеющимся ингредиентам: '
+        'агрегация по всем IngredientRecipe, подсчёт совпадений '
+        'по индексу ингредиент -> рецепты и rank_by_ingredients '
+        '(в PostgreSQL - по GIN-индексу Recipe.ingredient_ids)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--populate',
+            type=int,
+            default=0,
+            help='Создать столько рецептов на время замера, например '
+                 '1000000 (изменения откатываются)',
+        )
+        parser.add_argument(
+            '--ingredients-per-recipe', type=int, nargs=2, default=[3, 12],
+        )
+        parser.add_argument(
+            '--pantry',
+            type=int,
+            default=10,
+            help='Сколько ингредиентов у пользователя',
+        )
+        parser.add_argument(
+            '--zipf',
+            type=float,
+            default=1.0,
+            help='Показатель распределения Ципфа для частоты ингредиентов '
+                 'в рецептах и у пользователей, 0 - равномерно',
+        )
+        parser.add_argument('--limit', type=int, default=20)
+        parser.add_argument('--queries', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.ingredient_ids = list(
+            Ingredient.objects.values_list('id', flat=True)
+        )
+        if len(self.ingredient_ids) < options['pantry']:
+            raise CommandError(
+                'Ингредиентов меньше, чем --pantry; загрузите их '
+                'командой data_csv_for_db'
+            )
+        # Популярность ингредиента k-го по случайному порядку ~ 1 / k^s.
+        self.rng.shuffle(self.ingredient_ids)
+        self.cum_weights = None
+        if options['zipf'] > 0:
+            self.cum_weights = list(itertools.accumulate(
+                1 / rank ** options['zipf']
+                for rank in range(1, len(self.ingredient_ids) + 1)
+            ))
+        with transaction.atomic():
+            if options['populate']:
+                self.populate(options)
+            self.run(options)
+            transaction.set_rollback(True)
+
+    def populate(self, options):
+        author, _ = User.objects.get_or_create(
+            username='bench_cook',
+            defaults={'email': 'bench_cook@example.com'},
+        )
+        started = time.monotonic()
+        low, high = options['ingredients_per_recipe']
+        for start in range(0, options['populate'], POPULATE_CHUNK_SIZE):
+            size = min(POPULATE_CHUNK_SIZE, options['populate'] - start)
+            ingredients = [
+                sorted(self.sample(self.rng.randint(low, high)))
+                for _ in range(size)
+            ]
+            recipes = [
+                Recipe(
+                    author=author,
+                    name=f'Рецепт {start + index}',
+                    text='Описание',
+                    cooking_time=1,
+                    ingredients_count=len(ingredients[index]),
+                    ingredient_ids=ingredients[index],
+                )
+                for index in range(size)
+            ]
+            bulk_create_recipes(recipes)
+            IngredientRecipe.objects.bulk_create(
+                IngredientRecipe(
+                    recipe=recipe, ingredient_id=ingredient_id, amount=1
+                )
+                for recipe, recipe_ingredients in zip(recipes, ingredients)
+                for ingredient_id in recipe_ingredients
+            )
+        self.stdout.write(
+            f'Создано рецептов: {options["populate"]} '
+            f'({time.monotonic() - started:.1f} с)'
+        )
+
+    def run(self, options):
+        pantries = [
+            self.sample(options['pantry']) for _ in range(options['queries'])
+        ]
+        limit = options['limit']
+        results = {
+            'scan': self.measure(
+                lambda pantry: list(Recipe.objects.annotate(
+                    matched_count=Count(
+                        'recipes', filter=Q(recipes__ingredient__in=pantry)
+                    ),
+                ).filter(matched_count__gt=0).annotate(
+                    missing_count=F('ingredients_count') - F('matched_count')
+                ).order_by('missing_count', '-pub_date', '-id')[:limit]),
+                pantries,
+            ),
+            'postings': self.measure(
+                lambda pantry: list(Recipe.objects.filter(
+                    recipes__ingredient__in=pantry
+                ).annotate(
+                    matched_count=Count('recipes', distinct=True),
+                ).annotate(
+                    missing_count=F('ingredients_count') - F('matched_count')
+                ).order_by('missing_count', '-pub_date', '-id')[:limit]),
+                pantries,
+            ),
+            'rank': self.measure(
+                lambda pantry: list(rank_by_ingredients(
+                    Recipe.objects.all(), pantry
+                )[:limit]),
+                pantries,
+            ),
+        }
+        self.stdout.write(f'Рецептов: {Recipe.objects.count()}')
+        for label, timings in results.items():
+            timings.sort()
+            self.stdout.write(
+                f'{label:>8}: p50={statistics.median(timings):.1f} ms '
+                f'p95={timings[int(len(timings) * 0.95) - 1]:.1f} ms '
+                f'max={timings[-1]:.1f} ms'
+            )
+
+    def sample(self, count):
+        """count разных ингредиентов с учётом --zipf."""
+
+        if self.cum_weights is None:
+            return self.rng.sample(self.ingredient_ids, count)
+        chosen = set()
+        while len(chosen) < count:
+            chosen.update(self.rng.choices(
+                self.ingredient_ids,
+                cum_weights=self.cum_weights,
+                k=count - len(chosen),
+            ))
+        return list(chosen)
+
+    @staticmethod
+    def measure(search, pantries):
+        timings = []
+        for pantry in pantries:
+            started = time.perf_counter()
+            search(pantry)
+            timings.append((time.perf_counter() - started) * 1000)
+        return timings
@@ -0,0 +1,146 @@
+import random
+import statistics
+import time
+
+from api.pagination import FeedPagination
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from recipes.models import Recipe
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from users.models import Follow
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнение времени получения страницы ленты подписок: фильтр '
+        'author IN (подписки) и слияние по авторам. Данные создаются '
+        'со скошенным распределением и откатываются после замера'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--authors', type=int, default=2000)
+        parser.add_argument(
+            '--recipes',
+            type=int,
+            default=200000,
+            help='Всего рецептов; у авторов их число распределено по Ципфу',
+        )
+        parser.add_argument(
+            '--follows',
+            type=int,
+            nargs='+',
+            default=[10, 100, 1000],
+            help='Число подписок у читателей; авторы выбираются '
+                 'с вероятностью, пропорциональной их популярности',
+        )
+        parser.add_argument('--pages', type=int, nargs='+', default=[1, 50])
+        parser.add_argument('--limit', type=int, default=6)
+        parser.add_argument('--repeat', type=int, default=10)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        with transaction.atomic():
+            readers = self.populate(options)
+            self.run(readers, options)
+            transaction.set_rollback(True)
+
+    def populate(self, options):
+        User.objects.bulk_create(
+            User(
+                username=f'bench_feed_{index}',
+                email=f'bench_feed_{index}@example.com',
+            )
+            for index in range(options['authors'])
+        )
+        authors = list(User.objects.filter(
+            username__startswith='bench_feed_'
+        ).order_by('id'))
+        weights = [1 / rank for rank in range(1, len(authors) + 1)]
+        Recipe.objects.bulk_create(
+            Recipe(
+                author=author,
+                name='Рецепт',
+                text='Описание',
+                cooking_time=1,
+            )
+            for author in self.rng.choices(
+                authors, weights, k=options['recipes']
+            )
+        )
+        readers = []
+        for count in options['follows']:
+            reader = User.objects.create(
+                username=f'bench_feed_reader_{count}',
+                email=f'bench_feed_reader_{count}@example.com',
+            )
+            followed = set()
+            while len(followed) < min(count, len(authors)):
+                followed.add(self.rng.choices(authors, weights)[0].id)
+            Follow.objects.bulk_create(
+                Follow(user=reader, author_id=author_id)
+                for author_id in followed
+            )
+            readers.append((count, reader))
+        return readers
+
+    def run(self, readers, options):
+        factory = APIRequestFactory()
+        limit = options['limit']
+        for count, reader in readers:
+            followed = reader.followers.values('author')
+            naive = Recipe.objects.filter(author__in=followed).order_by(
+                *FeedPagination.ordering
+            )
+            for page in options['pages']:
+                cursor = ''
+                offset = (page - 1) * limit - 1
+                if offset >= 0:
+                    last = naive[offset:offset + 1].first()
+                    if last is None:
+                        continue
+                    cursor = FeedPagination().encode_cursor(
+                        (last.pub_date, last.id)
+                    )
+                request = Request(
+                    factory.get('/', {'cursor': cursor, 'limit': limit})
+                )
+                request.user = reader
+                position = FeedPagination().decode_cursor(
+                    request, Recipe.objects.all()
+                )
+                timings = {
+                    'in': self.measure(
+                        lambda: list(
+                            naive.filter(
+                                FeedPagination().get_seek_filter(position)
+                            )[:limit + 1] if position else naive[:limit + 1]
+                        ),
+                        options['repeat'],
+                    ),
+                    'merge': self.measure(
+                        lambda: FeedPagination().paginate_queryset(
+                            Recipe.objects.all(), request
+                        ),
+                        options['repeat'],
+                    ),
+                }
+                self.stdout.write(
+                    f'follows {count:>5}, page {page:>4}: ' + ', '.join(
+                        f'{label} p50={value:.3f} ms'
+                        for label, value in timings.items()
+                    )
+                )
+
+    @staticmethod
+    def measure(fetch, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            fetch()
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings)
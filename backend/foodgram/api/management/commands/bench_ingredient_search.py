@@ -0,0 +1,61 @@
+import random
+import statistics
+import time
+
+from api.ingredient_index import ingredient_index
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from recipes.models import Ingredient
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнение времени поиска ингредиентов по префиксу: '
+        'ORM-фильтр istartswith и индекс в памяти'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queries', type=int, default=500)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        names = list(Ingredient.objects.values_list('name', flat=True))
+        if not names:
+            raise CommandError('Таблица ингредиентов пуста')
+        rng = random.Random(options['seed'])
+        prefixes = [
+            name[:rng.randint(1, min(len(name), 4))]
+            for name in rng.choices(names, k=options['queries'])
+        ]
+        ingredient_index.search('')
+
+        results = {
+            'orm': self.measure(
+                lambda prefix: list(
+                    Ingredient.objects.filter(name__istartswith=prefix)
+                ),
+                prefixes,
+            ),
+            'index': self.measure(
+                lambda prefix: ingredient_index.search(
+                    prefix, limit=settings.INGREDIENT_SEARCH_LIMIT
+                ),
+                prefixes,
+            ),
+        }
+        for label, timings in results.items():
+            timings.sort()
+            self.stdout.write(
+                f'{label:>5}: p50={statistics.median(timings):.3f} ms '
+                f'p95={timings[int(len(timings) * 0.95) - 1]:.3f} ms '
+                f'max={timings[-1]:.3f} ms'
+            )
+
+    @staticmethod
+    def measure(search, prefixes):
+        timings = []
+        for prefix in prefixes:
+            started = time.perf_counter()
+            search(prefix)
+            timings.append((time.perf_counter() - started) * 1000)
+        return timings
@@ -0,0 +1,106 @@
+import statistics
+import time
+
+from api.pagination import CustomPagination, RecipeKeysetPagination
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from recipes.models import Recipe
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнение времени получения страницы рецептов при постраничной '
+        'пагинации (COUNT + OFFSET) и пагинации по ключу'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--pages', type=int, nargs='+', default=[1, 100, 10000],
+        )
+        parser.add_argument('--limit', type=int, default=6)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument(
+            '--populate',
+            type=int,
+            default=0,
+            help='Создать столько рецептов на время замера '
+                 '(изменения откатываются)',
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            if options['populate']:
+                self.populate(options['populate'])
+            self.run(options)
+            transaction.set_rollback(True)
+
+    def populate(self, count):
+        author, _ = User.objects.get_or_create(
+            username='bench_pagination',
+            defaults={'email': 'bench_pagination@example.com'},
+        )
+        Recipe.objects.bulk_create(
+            (
+                Recipe(
+                    author=author,
+                    name=f'Рецепт {index}',
+                    text='Описание',
+                    cooking_time=1,
+                )
+                for index in range(count)
+            ),
+        )
+
+    def run(self, options):
+        limit = options['limit']
+        total = Recipe.objects.count()
+        factory = APIRequestFactory()
+        queryset = Recipe.objects.all()
+        for page in options['pages']:
+            if (page - 1) * limit >= total:
+                raise CommandError(
+                    f'Рецептов {total}, страницы {page} нет; '
+                    f'используйте --populate'
+                )
+            request = Request(factory.get('/', {'page': page, 'limit': limit}))
+            offset = self.measure(
+                lambda: CustomPagination().paginate_queryset(
+                    queryset, request
+                ),
+                options['repeat'],
+            )
+            cursor = ''
+            if page > 1:
+                last = queryset.order_by(
+                    *RecipeKeysetPagination.ordering
+                )[(page - 1) * limit - 1]
+                cursor = RecipeKeysetPagination().encode_cursor(
+                    (last.pub_date, last.id)
+                )
+            request = Request(
+                factory.get('/', {'cursor': cursor, 'limit': limit})
+            )
+            keyset = self.measure(
+                lambda: RecipeKeysetPagination().paginate_queryset(
+                    queryset, request
+                ),
+                options['repeat'],
+            )
+            self.stdout.write(
+                f'page {page:>6}: offset p50={offset:.3f} ms, '
+                f'keyset p50={keyset:.3f} ms'
+            )
+
+    @staticmethod
+    def measure(paginate, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            paginate()
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings)
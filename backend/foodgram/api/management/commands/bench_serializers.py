@@ -0,0 +1,140 @@
+import statistics
+import time
+
+from api.renderers import CompactJSONRenderer
+from api.serializers import (IngredientReadSerializer, IngredientSerializer,
+                             RecipeReadSerializer, RecipeViewSerializer,
+                             TagReadSerializer, TagSerializer)
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Prefetch
+from recipes.models import Ingredient, IngredientRecipe, Recipe, Tag
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        'Стоимость сериализации и рендеринга одного рецепта: '
+        'RecipeViewSerializer + JSONRenderer против RecipeReadSerializer + '
+        'CompactJSONRenderer. Сначала проверяется, что ответы совпадают '
+        'байт в байт, при расхождении команда завершается с ошибкой.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=500)
+        parser.add_argument('--repeat', type=int, default=10)
+        parser.add_argument(
+            '--user',
+            help='Имя пользователя для is_favorited и is_subscribed, '
+                 'по умолчанию первый пользователь с избранным',
+        )
+
+    def handle(self, *args, **options):
+        recipes = list(
+            Recipe.objects.select_related('author').prefetch_related(
+                'tag',
+                Prefetch(
+                    'recipes',
+                    queryset=IngredientRecipe.objects.select_related(
+                        'ingredient'
+                    ),
+                ),
+            ).order_by('-pub_date', '-id')[:options['recipes']]
+        )
+        if not recipes:
+            raise CommandError(
+                'Нет рецептов для замера, сначала выполните generate_data'
+            )
+        context = {
+            'request': self.get_request(options['user']),
+            'image_rendition': 'medium',
+        }
+        self.verify(
+            'recipes', RecipeViewSerializer, RecipeReadSerializer,
+            recipes, context,
+        )
+        self.verify(
+            'tags', TagSerializer, TagReadSerializer,
+            Tag.objects.all(), context,
+        )
+        self.verify(
+            'ingredients', IngredientSerializer, IngredientReadSerializer,
+            Ingredient.objects.all(), context,
+        )
+        self.stdout.write(
+            f'Рецептов: {len(recipes)}, мкс на рецепт '
+            f'(медиана из {options["repeat"]})'
+        )
+        self.stdout.write(
+            f'{"":<12}{"сериализация":>14}{"рендеринг":>12}{"всего":>10}'
+        )
+        results = {}
+        for name, serializer_class, renderer in (
+            ('drf', RecipeViewSerializer, JSONRenderer()),
+            ('fast', RecipeReadSerializer, CompactJSONRenderer()),
+        ):
+            serialize, render = self.measure(
+                serializer_class, renderer, recipes, context, options
+            )
+            results[name] = serialize + render
+            self.stdout.write(
+                f'{name:<12}{serialize:>14.1f}{render:>12.1f}'
+                f'{serialize + render:>10.1f}'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Ускорение: {results["drf"] / results["fast"]:.1f}x'
+        ))
+
+    def get_request(self, username):
+        users = User.objects.all()
+        if username:
+            users = users.filter(username=username)
+        else:
+            users = users.filter(favorites__isnull=False)
+        request = Request(APIRequestFactory().get('/api/recipes/'))
+        request.user = users.first()
+        if request.user is None:
+            if username:
+                raise CommandError(f'Пользователь {username} не найден')
+            request.user = AnonymousUser()
+        return request
+
+    def verify(self, name, reference_class, fast_class, objects, context):
+        objects = list(objects)
+        expected = JSONRenderer().render(
+            reference_class(objects, many=True, context=context).data
+        )
+        actual = CompactJSONRenderer().render(
+            fast_class(objects, many=True, context=context).data
+        )
+        if actual == expected:
+            return
+        for obj in objects:
+            if CompactJSONRenderer().render(
+                fast_class(obj, context=context).data
+            ) != JSONRenderer().render(
+                reference_class(obj, context=context).data
+            ):
+                raise CommandError(f'{name}: ответы отличаются для {obj!r}')
+        raise CommandError(f'{name}: ответы отличаются')
+
+    def measure(self, serializer_class, renderer, recipes, context, options):
+        serialize_times = []
+        render_times = []
+        for _ in range(options['repeat']):
+            started = time.perf_counter()
+            data = serializer_class(recipes, many=True, context=context).data
+            serialized = time.perf_counter()
+            renderer.render(data)
+            serialize_times.append(serialized - started)
+            render_times.append(time.perf_counter() - serialized)
+        scale = 1e6 / len(recipes)
+        return (
+            statistics.median(serialize_times) * scale,
+            statistics.median(render_times) * scale,
+        )
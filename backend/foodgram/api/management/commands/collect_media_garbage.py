@@ -0,0 +1,190 @@
+import os
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import reduce
+from operator import or_
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Q
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаление файлов изображений рецептов (и их уменьшенных копий), '
+        'на которые не ссылается ни один рецепт. С --parts каталог '
+        'делится на части по хэшу имени файла, и за один проход '
+        'проверяется одна часть'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать, что будет удалено',
+        )
+        parser.add_argument(
+            '--min-age',
+            type=int,
+            default=3600,
+            help='Не трогать файлы моложе стольких секунд: они могут '
+                 'принадлежать ещё не сохранённому рецепту. Повторно '
+                 'загруженное изображение получает новое время изменения',
+        )
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument(
+            '--interval',
+            type=int,
+            default=0,
+            help='Повторять очистку каждые столько секунд, '
+                 'каждый раз для следующей части',
+        )
+        parser.add_argument(
+            '--parts',
+            type=int,
+            default=1,
+            help='На сколько частей делить каталог',
+        )
+        parser.add_argument(
+            '--part',
+            type=int,
+            default=0,
+            help='С какой части начать, от 0 до parts - 1',
+        )
+
+    def handle(self, *args, **options):
+        field = Recipe._meta.get_field('image')
+        try:
+            self.root = field.storage.path(field.upload_to)
+        except NotImplementedError:
+            raise CommandError('Поддерживается только файловое хранилище')
+        if not 0 <= options['part'] < options['parts']:
+            raise CommandError('Ожидается 0 <= part < parts')
+        self.upload_to = field.upload_to
+        self.options = options
+        part = options['part']
+        while True:
+            self.collect(part)
+            if not options['interval']:
+                return
+            part = (part + 1) % options['parts']
+            time.sleep(options['interval'])
+
+    def collect(self, part):
+        started = time.monotonic()
+        files = size = 0
+        with ThreadPoolExecutor(max_workers=self.options['workers']) as pool:
+            for batch_files, batch_size in self.sweep_batches(
+                pool, self.get_batches(part)
+            ):
+                files += batch_files
+                size += batch_size
+        verb = 'Будет удалено' if self.options['dry_run'] else 'Удалено'
+        self.stdout.write(self.style.SUCCESS(
+            f'Часть {part + 1} из {self.options["parts"]}. '
+            f'{verb} файлов: {files}, освобождено байт: {size} '
+            f'({time.monotonic() - started:.1f} с)'
+        ))
+
+    def sweep_batches(self, pool, batches):
+        """Как pool.map(self.sweep, batches), но в очереди не больше
+        двух пакетов на поток: память не зависит от числа файлов."""
+
+        pending = deque()
+        for batch in batches:
+            if len(pending) >= 2 * self.options['workers']:
+                yield pending.popleft().result()
+            pending.append(pool.submit(self.sweep, batch))
+        while pending:
+            yield pending.popleft().result()
+
+    def in_part(self, name, part):
+        return zlib.crc32(name.encode()) % self.options['parts'] == part
+
+    def get_batches(self, part):
+        """Пакеты файлов части part старше min-age из каталога
+        изображений и каталога renditions: (путь, имя файла, это копия ли).
+        """
+
+        deadline = self.get_deadline()
+        batch = []
+        for directory, rendition in ((self.root, False), (
+            os.path.join(self.root, 'renditions'), True
+        )):
+            if not os.path.isdir(directory):
+                continue
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if (
+                        not self.in_part(entry.name, part)
+                        or not entry.is_file()
+                        or entry.stat().st_mtime > deadline
+                    ):
+                        continue
+                    batch.append((entry.path, entry.name, rendition))
+                    if len(batch) == self.options['batch_size']:
+                        yield batch
+                        batch = []
+        if batch:
+            yield batch
+
+    def get_deadline(self):
+        return time.time() - self.options['min_age']
+
+    def get_original_prefix(self, name, rendition):
+        if rendition:
+            name = name.rsplit('_', 1)[0] + '.'
+        return self.upload_to + name
+
+    def sweep(self, batch):
+        """Проверяет пакет файлов одним запросом к БД и удаляет те,
+        на которые нет ссылок. Перед удалением время изменения
+        проверяется ещё раз: файл мог быть загружен повторно, пока шёл
+        запрос. Возвращает (число файлов, байт)."""
+
+        try:
+            originals = [
+                self.get_original_prefix(name, False)
+                for _, name, rendition in batch if not rendition
+            ]
+            prefixes = [
+                self.get_original_prefix(name, True)
+                for _, name, rendition in batch if rendition
+            ]
+            lookup = Q(image__in=originals) | reduce(
+                or_, (Q(image__startswith=prefix) for prefix in prefixes), Q()
+            )
+            referenced = set(
+                Recipe.objects.filter(lookup).values_list('image', flat=True)
+            )
+        finally:
+            connection.close()
+        referenced_prefixes = {
+            name.rsplit('.', 1)[0] + '.' for name in referenced
+        }
+        deadline = self.get_deadline()
+        files = size = 0
+        for path, name, rendition in batch:
+            name_in_storage = self.get_original_prefix(name, rendition)
+            if (
+                name_in_storage in referenced_prefixes if rendition
+                else name_in_storage in referenced
+            ):
+                continue
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if stat.st_mtime > deadline:
+                continue
+            files += 1
+            size += stat.st_size
+            if self.options['verbosity'] > 1:
+                self.stdout.write(path)
+            if not self.options['dry_run']:
+                os.remove(path)
+        return files, size
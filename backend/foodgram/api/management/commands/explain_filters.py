@@ -0,0 +1,110 @@
+import re
+from itertools import product
+
+from api.filters import RecipeFilters
+from api.pagination import RecipeKeysetPagination
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from recipes.models import Favorite, Recipe, Tag
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+SEQ_SCAN_PATTERNS = {
+    'postgresql': re.compile(r'Seq Scan on (\w+)'),
+    'sqlite': re.compile(r'\bSCAN (?:TABLE )?(\w+)(?!.*\bUSING\b)'),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'EXPLAIN для всех сочетаний фильтров списка рецептов; '
+        'отмечает последовательное чтение таблиц'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--ignore-table',
+            action='append',
+            default=[],
+            help='Таблица, полное чтение которой допустимо (например, '
+                 'маленький справочник recipes_tag)',
+        )
+        parser.add_argument(
+            '--disable-seqscan',
+            action='store_true',
+            help='PostgreSQL: SET enable_seqscan = off, чтобы проверить '
+                 'наличие индексного плана на небольших данных',
+        )
+        parser.add_argument('--verbose-plans', action='store_true')
+
+    def handle(self, *args, **options):
+        pattern = SEQ_SCAN_PATTERNS.get(connection.vendor)
+        if pattern is None:
+            raise CommandError(f'СУБД {connection.vendor} не поддерживается')
+        favorite = Favorite.objects.select_related('user').first()
+        recipe = Recipe.objects.first()
+        slugs = list(Tag.objects.values_list('slug', flat=True)[:2])
+        if favorite is None or recipe is None or len(slugs) < 2:
+            raise CommandError(
+                'Нужны хотя бы два тэга, рецепт и запись в избранном'
+            )
+        if options['disable_seqscan'] and connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET enable_seqscan = off')
+
+        flagged = 0
+        for params, queryset in self.get_querysets(
+            favorite.user, recipe, slugs
+        ):
+            plan = queryset.explain()
+            tables = sorted(
+                set(pattern.findall(plan)) - set(options['ignore_table'])
+            )
+            if tables:
+                flagged += 1
+                self.stdout.write(self.style.WARNING(
+                    f'{params}: seq scan {", ".join(tables)}'
+                ))
+            else:
+                self.stdout.write(f'{params}: ok')
+            if options['verbose_plans'] or tables:
+                self.stdout.write(plan)
+        if flagged:
+            raise CommandError(f'Планов с полным чтением таблиц: {flagged}')
+
+    def get_querysets(self, user, recipe, slugs):
+        """Запросы списка рецептов в том виде, в каком их строит
+        RecipeViewSet, для каждого сочетания фильтров и пагинации."""
+
+        factory = APIRequestFactory()
+        combinations = product(
+            ([], slugs[:1], slugs),
+            (None, recipe.author_id),
+            (None, 1),
+            (None, 1),
+            (False, True),
+        )
+        for tags, author, favorited, in_cart, keyset in combinations:
+            params = {
+                'tags': tags,
+                'author': author,
+                'is_favorited': favorited,
+                'is_in_shopping_cart': in_cart,
+            }
+            params = {key: value for key, value in params.items() if value}
+            request = Request(factory.get('/', params))
+            request.user = user
+            queryset = RecipeFilters(
+                params,
+                queryset=Recipe.objects.select_related('author'),
+                request=request,
+            ).qs
+            if keyset:
+                pagination = RecipeKeysetPagination()
+                queryset = queryset.order_by(
+                    *pagination.ordering
+                ).filter(
+                    pagination.get_seek_filter((recipe.pub_date, recipe.id))
+                )
+                params['cursor'] = True
+            yield params, queryset[:RecipeKeysetPagination.page_size]
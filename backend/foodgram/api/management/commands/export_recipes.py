@@ -0,0 +1,36 @@
+from api.bulk import export_recipes
+from django.core.management.base import BaseCommand
+from django.db.models import Prefetch
+from recipes.models import IngredientRecipe, Recipe
+
+
+class Command(BaseCommand):
+    help = 'Потоковая выгрузка рецептов в NDJSON в формате import_recipes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output',
+            default='-',
+            help='Файл NDJSON, по умолчанию stdout',
+        )
+        parser.add_argument(
+            '--author',
+            help='Выгрузить только рецепты автора с этой почтой',
+        )
+
+    def handle(self, *args, **options):
+        queryset = Recipe.objects.select_related('author').prefetch_related(
+            'tag',
+            Prefetch(
+                'recipes',
+                queryset=IngredientRecipe.objects.select_related('ingredient'),
+            ),
+        )
+        if options['author']:
+            queryset = queryset.filter(author__email=options['author'])
+        if options['output'] == '-':
+            for line in export_recipes(queryset):
+                self.stdout.write(line, ending='')
+            return
+        with open(options['output'], 'w', encoding='utf8') as file:
+            file.writelines(export_recipes(queryset))
@@ -0,0 +1,189 @@
+import random
+import time
+
+from api.bulk import bulk_create_recipes
+from api.common import create_recipe_relations
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
+from users.models import Follow
+
+User = get_user_model()
+
+USERNAME_PREFIX = 'bench_user_'
+PASSWORD = 'bench-password'
+CHUNK_SIZE = 5000
+
+
+class Command(BaseCommand):
+    help = (
+        'Генерация синтетических данных для нагрузочных замеров: '
+        'пользователи, рецепты, подписки, избранное и списки покупок. '
+        f'Пароль всех пользователей - {PASSWORD}'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--recipes', type=int, default=2000)
+        parser.add_argument(
+            '--ingredients',
+            type=int,
+            default=500,
+            help='Создать синтетические ингредиенты, если их меньше',
+        )
+        parser.add_argument('--tags', type=int, default=3)
+        parser.add_argument(
+            '--ingredients-per-recipe', type=int, nargs=2, default=[3, 10],
+        )
+        parser.add_argument(
+            '--tags-per-recipe', type=int, nargs=2, default=[1, 2],
+        )
+        parser.add_argument(
+            '--follows', type=int, default=10, help='Подписок у пользователя',
+        )
+        parser.add_argument(
+            '--favorites', type=int, default=20, help='Рецептов в избранном',
+        )
+        parser.add_argument(
+            '--carts', type=int, default=5, help='Рецептов в списке покупок',
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--clear',
+            action='store_true',
+            help='Сначала удалить ранее сгенерированных пользователей '
+                 'и их рецепты',
+        )
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        started = time.monotonic()
+        if options['clear']:
+            User.objects.filter(username__startswith=USERNAME_PREFIX).delete()
+        ingredients = self.ensure_ingredients(options['ingredients'])
+        tags = self.ensure_tags(options['tags'])
+        users = self.create_users(options['users'])
+        recipe_ids = self.create_recipes(users, ingredients, tags, options)
+        user_ids = [user.id for user in users]
+        self.create_links(
+            Follow, 'author_id', user_ids, user_ids, options['follows']
+        )
+        self.create_links(
+            Favorite, 'recipe_id', user_ids, recipe_ids, options['favorites']
+        )
+        self.create_links(
+            ShoppingCart, 'recipe_id', user_ids, recipe_ids, options['carts']
+        )
+        call_command('recipe_counters', stdout=self.stdout)
+        call_command('shopping_totals', stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS(
+            f'Пользователей: {len(users)}, рецептов: {len(recipe_ids)} '
+            f'({time.monotonic() - started:.1f} с)'
+        ))
+
+    def ensure_ingredients(self, count):
+        missing = count - Ingredient.objects.count()
+        if missing > 0:
+            Ingredient.objects.bulk_create(
+                (
+                    Ingredient(
+                        name=f'ингредиент {self.rng.getrandbits(48):x}',
+                        measurement_unit=self.rng.choice(('г', 'мл', 'шт')),
+                    )
+                    for _ in range(missing)
+                ),
+                ignore_conflicts=True,
+            )
+        return list(Ingredient.objects.all()[:max(count, 1)])
+
+    def ensure_tags(self, count):
+        for index in range(Tag.objects.count(), count):
+            Tag.objects.get_or_create(
+                slug=f'bench-{index}',
+                defaults={
+                    'name': f'Тэг {index}',
+                    'color': f'#{self.rng.getrandbits(24):06x}',
+                },
+            )
+        return list(Tag.objects.all())
+
+    def create_users(self, count):
+        password = make_password(PASSWORD)
+        start = User.objects.filter(
+            username__startswith=USERNAME_PREFIX
+        ).count()
+        User.objects.bulk_create(
+            User(
+                username=f'{USERNAME_PREFIX}{index}',
+                email=f'{USERNAME_PREFIX}{index}@example.com',
+                first_name='Bench',
+                last_name=str(index),
+                password=password,
+            )
+            for index in range(start, start + count)
+        )
+        return list(User.objects.filter(
+            username__startswith=USERNAME_PREFIX
+        ).order_by('id'))
+
+    def create_recipes(self, users, ingredients, tags, options):
+        low, high = options['ingredients_per_recipe']
+        tags_low, tags_high = options['tags_per_recipe']
+        high = min(high, len(ingredients))
+        tags_high = min(tags_high, len(tags))
+        recipe_ids = []
+        for start in range(0, options['recipes'], CHUNK_SIZE):
+            size = min(CHUNK_SIZE, options['recipes'] - start)
+            items = []
+            for index in range(start, start + size):
+                recipe_ingredients = self.rng.sample(
+                    ingredients, self.rng.randint(min(low, high), high)
+                )
+                recipe_tags = self.rng.sample(
+                    tags, self.rng.randint(min(tags_low, tags_high), tags_high)
+                )
+                items.append((
+                    Recipe(
+                        author=self.rng.choice(users),
+                        name=f'Рецепт {index}',
+                        text='Синтетический рецепт для замеров',
+                        cooking_time=self.rng.randint(5, 120),
+                        ingredients_count=len(recipe_ingredients),
+                        ingredient_ids=sorted(
+                            ingredient.id for ingredient in recipe_ingredients
+                        ),
+                    ),
+                    [
+                        {
+                            'ingredient': {'id': ingredient},
+                            'amount': self.rng.randint(1, 500),
+                        }
+                        for ingredient in recipe_ingredients
+                    ],
+                    {tag.id: tag for tag in recipe_tags},
+                ))
+            with transaction.atomic():
+                bulk_create_recipes([recipe for recipe, _, _ in items])
+                create_recipe_relations(items)
+            recipe_ids.extend(recipe.id for recipe, _, _ in items)
+        return recipe_ids
+
+    def create_links(self, model, field, user_ids, target_ids, per_user):
+        """Связи пользователей с per_user случайными объектами."""
+
+        objects = []
+        for user_id in user_ids:
+            targets = [
+                target_id for target_id in self.rng.sample(
+                    target_ids, min(per_user + 1, len(target_ids))
+                )
+                if target_id != user_id or field != 'author_id'
+            ][:per_user]
+            objects.extend(
+                model(user_id=user_id, **{field: target_id})
+                for target_id in targets
+            )
+        model.objects.bulk_create(objects, ignore_conflicts=True)
@@ -0,0 +1,57 @@
+import sys
+import time
+
+from api.bulk import import_recipes, read_ndjson
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        'Массовый импорт рецептов из NDJSON: тэги по slug, ингредиенты '
+        'по названию и единице измерения'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл NDJSON или - для stdin')
+        parser.add_argument(
+            '--author',
+            required=True,
+            help='Почта или username автора рецептов',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=settings.RECIPE_IMPORT_BATCH_SIZE,
+        )
+
+    def handle(self, *args, **options):
+        author = User.objects.filter(
+            email=options['author']
+        ).first() or User.objects.filter(
+            username=options['author']
+        ).first()
+        if author is None:
+            raise CommandError(f'Пользователь не найден: {options["author"]}')
+        started = time.monotonic()
+        if options['path'] == '-':
+            report = self.import_file(sys.stdin, author, options)
+        else:
+            with open(options['path'], encoding='utf8') as file:
+                report = self.import_file(file, author, options)
+        elapsed = time.monotonic() - started
+        for error in report['errors']:
+            self.stderr.write(f'Строка {error["line"]}: {error["errors"]}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано рецептов: {report["created"]}, '
+            f'ошибок: {len(report["errors"])} за {elapsed:.1f} с '
+            f'({report["created"] / max(elapsed, 1e-6):.0f} рецептов/с)'
+        ))
+
+    def import_file(self, file, author, options):
+        return import_recipes(
+            read_ndjson(file), author, options['batch_size']
+        )
@@ -0,0 +1,63 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from api.images import get_renditions_key, make_renditions, mark_renditions
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from recipes.importers import batched
+from recipes.models import Recipe
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        'Создание недостающих уменьшенных копий изображений рецептов: '
+        'для изображений, загруженных до появления копий или до смены '
+        'RECIPE_IMAGE_RENDITION_FORMAT, и для заданий фонового пула, '
+        'потерянных при перезапуске сервера'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=settings.RECIPE_IMAGE_WORKERS,
+        )
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Проверить и изображения, копии которых уже отмечены '
+                 'как созданные',
+        )
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image='').exclude(image=None)
+        if not options['all']:
+            recipes = recipes.exclude(image_renditions=get_renditions_key())
+        names = recipes.order_by().values_list('image', flat=True).distinct()
+        done = failed = 0
+        workers = max(options['workers'], 1)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for batch in batched(names.iterator(), workers * 4):
+                made = [
+                    name for name, ok in zip(
+                        batch, pool.map(self.make_renditions, batch)
+                    ) if ok
+                ]
+                mark_renditions(made)
+                done += len(made)
+                failed += len(batch) - len(made)
+        self.stdout.write(self.style.SUCCESS(
+            f'Изображений с копиями: {done}, ошибок: {failed}'
+        ))
+        if failed:
+            raise CommandError(f'Не удалось создать копии для {failed}')
+
+    def make_renditions(self, name):
+        try:
+            make_renditions(name)
+        except Exception:
+            logger.exception('Не удалось создать копии изображения %s', name)
+            return False
+        return True
@@ -0,0 +1,342 @@
+import logging
+import re
+import threading
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from contextlib import ExitStack
+from hmac import compare_digest
+from time import perf_counter
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.base.base import BaseDatabaseWrapper
+from django.http import Http404, HttpResponse, HttpResponseForbidden
+from rest_framework import serializers
+
+from .cache import recipe_list_cache
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+WHITESPACE_RE = re.compile(r'\s+')
+
+_local = threading.local()
+
+
+class RequestMetrics:
+    """Замеры одного запроса: число и время SQL-запросов,
+    время сериализации и повторы одинаковых шаблонов SQL."""
+
+    def __init__(self):
+        self.query_count = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.serializer_depth = 0
+        self.templates = Counter()
+
+    def execute(self, execute, sql, params, many, context):
+        started = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += perf_counter() - started
+            self.query_count += 1
+            self.templates[sql] += 1
+
+    def get_repeated_templates(self, threshold):
+        return [
+            (WHITESPACE_RE.sub(' ', sql), count)
+            for sql, count in self.templates.items()
+            if count > threshold
+        ]
+
+
+class MetricsRegistry:
+    """Накопленные метрики процесса по парам (представление, действие)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = defaultdict(lambda: {
+            'requests': 0,
+            'queries': 0,
+            'db_seconds': 0.0,
+            'serializer_seconds': 0.0,
+            'n_plus_one': 0,
+            'duration_sum': 0.0,
+            'buckets': [0] * (len(LATENCY_BUCKETS) + 1),
+        })
+        self._waits = defaultdict(lambda: {
+            'count': 0,
+            'sum': 0.0,
+            'buckets': [0] * (len(LATENCY_BUCKETS) + 1),
+        })
+        self._recycled = Counter()
+
+    def record(self, labels, metrics, duration, n_plus_one):
+        with self._lock:
+            stats = self._stats[labels]
+            stats['requests'] += 1
+            stats['queries'] += metrics.query_count
+            stats['db_seconds'] += metrics.db_time
+            stats['serializer_seconds'] += metrics.serializer_time
+            stats['n_plus_one'] += n_plus_one
+            stats['duration_sum'] += duration
+            stats['buckets'][bisect_left(LATENCY_BUCKETS, duration)] += 1
+
+    def record_wait(self, pool, seconds):
+        """Ожидание ресурса пула: открытие соединения с БД (db_connect)
+        или свободного потока обработчика ASGI."""
+
+        with self._lock:
+            stats = self._waits[pool]
+            stats['count'] += 1
+            stats['sum'] += seconds
+            stats['buckets'][bisect_left(LATENCY_BUCKETS, seconds)] += 1
+
+    def record_recycled(self, alias):
+        with self._lock:
+            self._recycled[alias] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                labels: dict(stats, buckets=list(stats['buckets']))
+                for labels, stats in self._stats.items()
+            }
+
+    def render(self):
+        """Метрики в текстовом формате Prometheus."""
+
+        snapshot = sorted(self.snapshot().items())
+        lines = []
+        counters = (
+            ('requests', 'requests_total', 'Число запросов'),
+            ('queries', 'db_queries_total', 'Число SQL-запросов'),
+            ('db_seconds', 'db_seconds_total', 'Время SQL-запросов'),
+            (
+                'serializer_seconds',
+                'serializer_seconds_total',
+                'Время сериализации',
+            ),
+            (
+                'n_plus_one',
+                'n_plus_one_total',
+                'Запросы с повторяющимся шаблоном SQL',
+            ),
+        )
+        for key, name, description in counters:
+            lines.append(f'# HELP foodgram_api_{name} {description}')
+            lines.append(f'# TYPE foodgram_api_{name} counter')
+            for labels, stats in snapshot:
+                lines.append(
+                    f'foodgram_api_{name}{format_labels(labels)} {stats[key]}'
+                )
+        name = 'foodgram_api_request_duration_seconds'
+        lines.append(f'# HELP {name} Время обработки запроса')
+        lines.append(f'# TYPE {name} histogram')
+        for labels, stats in snapshot:
+            total = 0
+            for bound, count in zip(
+                (*LATENCY_BUCKETS, '+Inf'), stats['buckets']
+            ):
+                total += count
+                lines.append(
+                    f'{name}_bucket{format_labels(labels, le=bound)} {total}'
+                )
+            lines.append(
+                f'{name}_sum{format_labels(labels)} {stats["duration_sum"]}'
+            )
+            lines.append(
+                f'{name}_count{format_labels(labels)} {stats["requests"]}'
+            )
+        lines.extend(self.render_pools())
+        for key, value in recipe_list_cache.stats().items():
+            name = f'foodgram_recipe_list_cache_{key}_total'
+            lines.append(f'# TYPE {name} counter')
+            lines.append(f'{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def render_pools(self):
+        with self._lock:
+            waits = sorted(
+                (pool, dict(stats, buckets=list(stats['buckets'])))
+                for pool, stats in self._waits.items()
+            )
+            recycled = sorted(self._recycled.items())
+        name = 'foodgram_pool_wait_seconds'
+        lines = [
+            f'# HELP {name} Ожидание соединения с БД или потока обработчика',
+            f'# TYPE {name} histogram',
+        ]
+        for pool, stats in waits:
+            total = 0
+            for bound, count in zip(
+                (*LATENCY_BUCKETS, '+Inf'), stats['buckets']
+            ):
+                total += count
+                lines.append(
+                    f'{name}_bucket{{pool="{pool}",le="{bound}"}} {total}'
+                )
+            lines.append(f'{name}_sum{{pool="{pool}"}} {stats["sum"]}')
+            lines.append(f'{name}_count{{pool="{pool}"}} {stats["count"]}')
+        name = 'foodgram_db_connections_recycled_total'
+        lines.append(
+            f'# HELP {name} Соединения, закрытые проверкой работоспособности'
+        )
+        lines.append(f'# TYPE {name} counter')
+        for alias, count in recycled:
+            lines.append(f'{name}{{alias="{alias}"}} {count}')
+        return lines
+
+
+def format_labels(labels, **extra):
+    view, action = labels
+    pairs = [('view', view), ('action', action), *extra.items()]
+    return '{' + ','.join(
+        f'{key}="{value}"' for key, value in pairs
+    ) + '}'
+
+
+registry = MetricsRegistry()
+
+
+def get_view_labels(view_func, method):
+    """(представление, действие) для функции представления. Для ViewSet
+    действие берётся из карты метод -> action, для остальных
+    представлений DRF это HTTP-метод."""
+
+    method = method.lower()
+    view_class = getattr(view_func, 'cls', None)
+    if view_class is None:
+        return f'{view_func.__module__}.{view_func.__name__}', method
+    actions = getattr(view_func, 'actions', None) or {}
+    return view_class.__name__, actions.get(method, method)
+
+
+def timed_data(data_property):
+    """Оборачивает свойство data сериализатора: время учитывается
+    только у внешнего сериализатора, вложенные не считаются повторно."""
+
+    fget = data_property.fget
+
+    def data(self):
+        metrics = getattr(_local, 'metrics', None)
+        if metrics is None or metrics.serializer_depth:
+            return fget(self)
+        metrics.serializer_depth += 1
+        started = perf_counter()
+        try:
+            return fget(self)
+        finally:
+            metrics.serializer_time += perf_counter() - started
+            metrics.serializer_depth -= 1
+
+    data.timed = True
+    return property(data)
+
+
+def timed_connect(connect):
+    """Оборачивает открытие соединения с БД: время попадает
+    в метрики пула db_connect."""
+
+    def wrapper(self):
+        started = perf_counter()
+        try:
+            return connect(self)
+        finally:
+            registry.record_wait('db_connect', perf_counter() - started)
+
+    wrapper.timed = True
+    return wrapper
+
+
+def install_connect_timing():
+    if not getattr(BaseDatabaseWrapper.connect, 'timed', False):
+        BaseDatabaseWrapper.connect = timed_connect(
+            BaseDatabaseWrapper.connect
+        )
+
+
+def install_serializer_timing():
+    for serializer_class in (
+        serializers.Serializer, serializers.ListSerializer
+    ):
+        if not getattr(serializer_class.data.fget, 'timed', False):
+            serializer_class.data = timed_data(serializer_class.data)
+
+
+class MetricsMiddleware:
+    """Замеры запросов к API: число и время SQL-запросов, время
+    сериализации и общее время по представлению и действию DRF.
+
+    Включается настройкой API_METRICS_ENABLED. Добавляет заголовок
+    Server-Timing, пишет в лог запросы, где один шаблон SQL выполнен
+    больше API_METRICS_N_PLUS_ONE_THRESHOLD раз. Метрики хранятся
+    в памяти процесса и отдаются представлением metrics_view.
+    """
+
+    def __init__(self, get_response):
+        if not settings.API_METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        install_serializer_timing()
+        install_connect_timing()
+
+    def __call__(self, request):
+        metrics = RequestMetrics()
+        request._metrics_labels = None
+        _local.metrics = metrics
+        started = perf_counter()
+        try:
+            with ExitStack() as stack:
+                for alias in connections:
+                    stack.enter_context(
+                        connections[alias].execute_wrapper(metrics.execute)
+                    )
+                response = self.get_response(request)
+        finally:
+            _local.metrics = None
+        duration = perf_counter() - started
+        labels = request._metrics_labels
+        if labels is None:
+            return response
+        repeated = metrics.get_repeated_templates(
+            settings.API_METRICS_N_PLUS_ONE_THRESHOLD
+        )
+        for sql, count in repeated:
+            logger.warning(
+                'N+1 в %s.%s: %d раз %s', *labels, count, sql
+            )
+        registry.record(labels, metrics, duration, int(bool(repeated)))
+        response['Server-Timing'] = ', '.join((
+            f'db;dur={metrics.db_time * 1000:.1f};'
+            f'desc="{metrics.query_count} queries"',
+            f'serializer;dur={metrics.serializer_time * 1000:.1f}',
+            f'total;dur={duration * 1000:.1f}',
+        ))
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._metrics_labels = get_view_labels(view_func, request.method)
+
+
+def metrics_view(request):
+    """Метрики в формате Prometheus. Если задан API_METRICS_TOKEN,
+    нужен заголовок Authorization: Bearer <токен>, иначе метрики
+    доступны только администраторам, вошедшим через сессию."""
+
+    if not settings.API_METRICS_ENABLED:
+        raise Http404
+    token = settings.API_METRICS_TOKEN
+    if token:
+        allowed = compare_digest(
+            request.META.get('HTTP_AUTHORIZATION', ''), f'Bearer {token}'
+        )
+    else:
+        allowed = request.user.is_staff
+    if not allowed:
+        return HttpResponseForbidden()
+    return HttpResponse(
+        registry.render(), content_type='text/plain; version=0.0.4'
+    )
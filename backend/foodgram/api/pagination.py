@@ -1,6 +1,208 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from .common import get_feed_recipe_ids
 
 
 class CustomPagination(PageNumberPagination):
     page_size_query_param = 'limit'
     page_size = 6
+
+
+class KeysetPagination(BasePagination):
+    """Пагинация по ключу (seek) без COUNT(*) и OFFSET.
+
+    Курсор хранит значения полей сортировки последнего объекта страницы,
+    следующая страница выбирается условием «строго после курсора»,
+    что позволяет использовать индекс по этим полям на любой глубине.
+    Используется сортировка, уже заданная запросу (популярные,
+    релевантность поиска, подбор по ингредиентам), без неё - ordering.
+    Поля могут быть аннотациями, последнее поле не должно повторяться.
+    """
+
+    cursor_query_param = 'cursor'
+    page_size_query_param = CustomPagination.page_size_query_param
+    page_size = CustomPagination.page_size
+    max_page_size = 100
+    ordering = ('-id',)
+    invalid_cursor_message = 'Неверный курсор'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        if not queryset.query.order_by:
+            queryset = queryset.order_by(*self.ordering)
+        self.keys = self.get_keys(queryset)
+        position = self.decode_cursor(request, queryset)
+        page = self.get_page(queryset, position, page_size + 1)
+        self.next_position = None
+        if len(page) > page_size:
+            page = page[:page_size]
+            self.next_position = [
+                getattr(page[-1], field) for field, _ in self.keys
+            ]
+        return page
+
+    def get_keys(self, queryset=None):
+        """Поля сортировки и признак убывания: из запроса, если
+        сортировка ему задана, иначе из ordering."""
+
+        ordering = self.ordering
+        if queryset is not None and queryset.query.order_by:
+            ordering = queryset.query.order_by
+        return [
+            (field.lstrip('-'), field.startswith('-')) for field in ordering
+        ]
+
+    def get_page(self, queryset, position, limit):
+        if position is not None:
+            queryset = queryset.filter(
+                self.get_seek_filter(position, self.keys)
+            )
+        return list(queryset[:limit])
+
+    @staticmethod
+    def get_after_lookup(field, descending, value, inclusive=False):
+        lookup = 'lt' if descending else 'gt'
+        if inclusive:
+            lookup += 'e'
+        return Q(**{f'{field}__{lookup}': value})
+
+    def get_seek_filter(self, position, keys=None):
+        """(f1, f2) < (v1, v2) в виде, понятном планировщику:
+        f1 <= v1 AND (f1 < v1 OR (f1 = v1 AND f2 < v2)).
+        Для полей по возрастанию знаки сравнения обратные.
+        Без keys используются поля ordering."""
+
+        if keys is None:
+            keys = self.get_keys()
+        pairs = list(zip(keys, position))
+        (field, descending), value = pairs[-1]
+        seek = self.get_after_lookup(field, descending, value)
+        for (field, descending), value in reversed(pairs[:-1]):
+            seek = (
+                self.get_after_lookup(field, descending, value)
+                | Q(**{field: value}) & seek
+            )
+        (field, descending), value = pairs[0]
+        return self.get_after_lookup(
+            field, descending, value, inclusive=True
+        ) & seek
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def decode_cursor(self, request, queryset):
+        """Значения полей сортировки queryset из курсора запроса."""
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None
+        keys = self.get_keys(queryset)
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            if len(values) != len(keys):
+                raise ValueError
+            return [
+                self.to_python(queryset, field, value)
+                for (field, _), value in zip(keys, values)
+            ]
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    @staticmethod
+    def to_python(queryset, field, value):
+        """Значение поля из курсора. Аннотации сортировки (ранг,
+        число недостающих ингредиентов) - числа."""
+
+        if field not in queryset.query.annotations:
+            return queryset.model._meta.get_field(field).to_python(value)
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError
+        return value
+
+    def encode_cursor(self, position):
+        values = [
+            value.isoformat() if hasattr(value, 'isoformat') else value
+            for value in position
+        ]
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            self.encode_cursor(self.next_position),
+        )
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+
+
+class RecipeKeysetPagination(KeysetPagination):
+    ordering = ('-pub_date', '-id')
+
+
+class FeedPagination(RecipeKeysetPagination):
+    """Лента рецептов авторов, на которых подписан пользователь.
+
+    В PostgreSQL страница собирается слиянием: для каждого автора
+    берётся не больше limit рецептов после курсора по индексу
+    recipe_author_pub_date_idx, и из них выбираются limit последних.
+    Время не зависит от общего числа рецептов авторов, а число
+    подписок влияет только на количество коротких проходов по индексу.
+    """
+
+    def get_page(self, queryset, position, limit):
+        user = self.request.user
+        if connection.vendor != 'postgresql':
+            return super().get_page(
+                queryset.filter(author__followings__user=user),
+                position,
+                limit,
+            )
+        ids = get_feed_recipe_ids(user.id, position, limit)
+        recipes = queryset.in_bulk(ids)
+        return [recipes[pk] for pk in ids if pk in recipes]
+
+
+class KeysetPaginationMixin:
+    """Переключает представление на keyset_pagination_class,
+    если в запросе передан параметр cursor (для первой страницы - пустой)."""
+
+    keyset_pagination_class = KeysetPagination
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            cursor_mode = (
+                self.keyset_pagination_class.cursor_query_param
+                in self.request.query_params
+            )
+            if cursor_mode:
+                self._paginator = self.keyset_pagination_class()
+            else:
+                self._paginator = (
+                    self.pagination_class() if self.pagination_class else None
+                )
+        return self._paginator
@@ -0,0 +1,35 @@
+import json
+
+from rest_framework.compat import LONG_SEPARATORS, SHORT_SEPARATORS
+from rest_framework.renderers import JSONRenderer
+
+
+class CompactJSONRenderer(JSONRenderer):
+    """JSONRenderer с одним заранее созданным кодировщиком.
+
+    Данные сериализаторов чтения состоят только из встроенных типов,
+    их кодирует C-реализация json без вызова default кодировщика DRF.
+    Если в данных есть другие типы или запрошены отступы, ответ строит
+    JSONRenderer. Результат байт в байт совпадает с JSONRenderer.
+    """
+
+    def __init__(self):
+        self.encoder = json.JSONEncoder(
+            ensure_ascii=self.ensure_ascii,
+            allow_nan=not self.strict,
+            separators=SHORT_SEPARATORS if self.compact else LONG_SEPARATORS,
+        )
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if self.get_indent(
+            accepted_media_type, renderer_context or {}
+        ) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = self.encoder.encode(data)
+        except TypeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        ret = ret.replace('\u2028', '\\u2028').replace('\u2029', '\\u2029')
+        return ret.encode()
@@ -1,12 +1,19 @@
+from operator import attrgetter
+
 from django.contrib.auth import get_user_model
+from django.db import transaction
 from djoser.serializers import UserCreateSerializer, UserSerializer
 from recipes.models import (Favorite, Ingredient, IngredientRecipe, Recipe,
-                            ShoppingCart, Tag, TagRecipe)
+                            ShoppingCart, ShoppingCartIngredient, Tag)
 from rest_framework import serializers
 from rest_framework.validators import UniqueTogetherValidator
 from users.models import Follow
-from .common import create_update_instance_recipe, get_is_field_action
-from .serializers_fields import Base64ImageField, TagListField
+from .common import (create_update_instance_recipe, get_ingredient_ids,
+                     get_is_field_action, get_recipes_limit,
+                     get_viewer_state, update_recipe_relations)
+from .images import schedule_renditions
+from .serializers_fields import (Base64ImageField, RenditionImageField,
+                                 TagListField, get_image_url)
 
 User = get_user_model()
 
@@ -89,6 +96,7 @@ class IngredientInRecipeSerializer(serializers.ModelSerializer):
 
 
 class RecipeViewSerializer(serializers.ModelSerializer):
+    image = RenditionImageField()
     author = CustomUserSerializer(read_only=True)
     tags = TagSerializer(many=True, source='tag')
     ingredients = serializers.SerializerMethodField(
@@ -120,7 +128,7 @@ class RecipeViewSerializer(serializers.ModelSerializer):
         )
 
     def get_ingredients(self, obj):
-        ingredients = IngredientRecipe.objects.filter(recipe=obj)
+        ingredients = obj.recipes.all()
         return IngredientInRecipeSerializer(ingredients, many=True).data
 
     def get_is_favorited(self, obj):
@@ -138,6 +146,85 @@ class RecipeViewSerializer(serializers.ModelSerializer):
         return get_is_field_action(request, ShoppingCart, data)
 
 
+def get_accessors(fields):
+    return tuple((field, attrgetter(field)) for field in fields)
+
+
+class AttributeSerializer(serializers.Serializer):
+    """Сериализатор только для чтения без полей DRF: словарь строится
+    заранее созданными функциями доступа к атрибутам. Подходит для
+    полей, которые ModelSerializer отдаёт без преобразования: числа,
+    строки и None."""
+
+    accessors = ()
+
+    def to_representation(self, instance):
+        return {name: get(instance) for name, get in self.accessors}
+
+
+class TagReadSerializer(AttributeSerializer):
+    accessors = get_accessors(TagSerializer.Meta.fields)
+
+
+class IngredientReadSerializer(AttributeSerializer):
+    accessors = get_accessors(IngredientSerializer.Meta.fields)
+
+
+class RecipeReadSerializer(serializers.Serializer):
+    """Быстрая замена RecipeViewSerializer для GET-запросов с тем же
+    JSON: рецепт, автор, тэги и ингредиенты собираются в словари
+    напрямую из объектов, загруженных RecipeViewSet.get_queryset."""
+
+    author_accessors = get_accessors(
+        ('email', 'id', 'username', 'first_name', 'last_name')
+    )
+    tag_accessors = TagReadSerializer.accessors
+
+    def get_viewer_ids(self, model):
+        request = self.context.get('request')
+        if not request or not hasattr(request, 'user'):
+            return frozenset()
+        return get_viewer_state(request).get_ids(model)
+
+    def to_representation(self, recipe):
+        author = recipe.author
+        author_data = {
+            name: get(author) for name, get in self.author_accessors
+        }
+        author_data['is_subscribed'] = (
+            author.id in self.get_viewer_ids(Follow)
+        )
+        return {
+            'id': recipe.id,
+            'tags': [
+                {name: get(tag) for name, get in self.tag_accessors}
+                for tag in recipe.tag.all()
+            ],
+            'author': author_data,
+            'ingredients': [
+                {
+                    'id': item.ingredient_id,
+                    'name': item.ingredient.name,
+                    'measurement_unit': item.ingredient.measurement_unit,
+                    'amount': item.amount,
+                }
+                for item in recipe.recipes.all()
+            ],
+            'is_favorited': recipe.id in self.get_viewer_ids(Favorite),
+            'is_in_shopping_cart': (
+                recipe.id in self.get_viewer_ids(ShoppingCart)
+            ),
+            'name': recipe.name,
+            'image': get_image_url(
+                recipe.image,
+                self.context.get('image_rendition'),
+                self.context.get('request'),
+            ),
+            'text': recipe.text,
+            'cooking_time': recipe.cooking_time,
+        }
+
+
 class RecipeSerializer(serializers.ModelSerializer):
     ingredients = IngredientInRecipeSerializer(many=True)
     tags = TagListField()
@@ -166,23 +253,36 @@ class RecipeSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
-        recipe = Recipe.objects.create(**validated_data)
+        recipe = Recipe.objects.create(
+            **validated_data,
+            ingredients_count=len(ingredients),
+            ingredient_ids=get_ingredient_ids(ingredients),
+        )
 
         create_update_instance_recipe(recipe, ingredients, tags)
+        schedule_renditions(recipe.image)
 
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
 
-        ingredients = validated_data.pop('ingredients')
-        tags = validated_data.pop('tags')
+        ingredients = validated_data.pop('ingredients', None)
+        tags = validated_data.pop('tags', None)
 
-        TagRecipe.objects.filter(recipe=instance).delete()
-        IngredientRecipe.objects.filter(recipe=instance).delete()
-
-        create_update_instance_recipe(instance, ingredients, tags)
+        delta = update_recipe_relations(instance, ingredients, tags)
+        if delta:
+            ShoppingCartIngredient.objects.apply_delta(
+                tuple(instance.shoppings.values_list('user_id', flat=True)),
+                delta,
+            )
 
-        return super().update(instance, validated_data)
+        if 'image' in validated_data:
+            validated_data['image_renditions'] = ''
+        instance = super().update(instance, validated_data)
+        if 'image' in validated_data:
+            schedule_renditions(instance.image)
+        return instance
 
     def validate_ingredients(self, value):
 
@@ -198,18 +298,55 @@ class RecipeSerializer(serializers.ModelSerializer):
         return value
 
     def to_representation(self, instance):
-        return RecipeViewSerializer(
-            instance,
-            context={'request': self.context.get('request')}
-        ).data
+        return RecipeViewSerializer(instance, context=self.context).data
 
 
-class RecipeNestedSerializer(serializers.ModelSerializer):
-    image = serializers.ImageField(
-        use_url=True,
-        allow_null=True,
-        required=False,
+class IngredientImportSerializer(serializers.Serializer):
+    name = serializers.CharField(max_length=254)
+    measurement_unit = serializers.CharField(max_length=128)
+    amount = serializers.IntegerField(min_value=1, max_value=32767)
+
+
+class RecipeImportSerializer(serializers.Serializer):
+    """Рецепт для массового импорта: тэги задаются slug, ингредиенты
+    названием и единицей измерения. Их наличие в БД проверяется
+    для всего пакета сразу, см. api.bulk."""
+
+    name = serializers.CharField(max_length=200)
+    text = serializers.CharField(max_length=512)
+    cooking_time = serializers.IntegerField(min_value=1)
+    image = serializers.CharField(
+        required=False, allow_null=True, allow_blank=True
     )
+    tags = serializers.ListField(
+        child=serializers.SlugField(max_length=200), allow_empty=False
+    )
+    ingredients = IngredientImportSerializer(many=True, allow_empty=False)
+
+    def validate_image(self, value):
+        if not value:
+            return None
+        if value.startswith('data:image'):
+            return Base64ImageField().to_internal_value(value)
+        field = Recipe._meta.get_field('image')
+        if value.startswith(field.upload_to) and field.storage.exists(value):
+            return value
+        raise serializers.ValidationError(
+            'Ожидается изображение в base64 или имя уже загруженного файла'
+        )
+
+    def validate_ingredients(self, value):
+        keys = [(item['name'], item['measurement_unit']) for item in value]
+        if len(keys) > len(set(keys)):
+            raise serializers.ValidationError(
+                'Для одного блюда указывать более одного'
+                'раза один и тот же ингредиент - недопустимо'
+            )
+        return value
+
+
+class RecipeNestedSerializer(serializers.ModelSerializer):
+    image = RenditionImageField(rendition='thumbnail')
 
     class Meta:
         model = Recipe
@@ -253,15 +390,22 @@ class SubscribeSerializer(serializers.ModelSerializer):
         ]
 
     def get_recipes(self, obj):
-        queryset = Recipe.objects.filter(author=obj.author)
+        request = self.context.get('request')
+        queryset = getattr(obj.author, 'latest_recipes', None)
+        if queryset is None:
+            queryset = Recipe.objects.filter(
+                author=obj.author
+            )[:get_recipes_limit(request)]
         serializer = RecipeNestedSerializer(
             queryset,
             many=True,
-            context={'request': self.context.get('request')},
+            context={'request': request},
         )
         return serializer.data
 
     def get_recipes_count(self, obj):
+        if hasattr(obj, 'recipes_count'):
+            return obj.recipes_count
         return Recipe.objects.filter(author=obj.author).count()
 
     def get_is_subscribed(self, obj):
@@ -278,12 +422,7 @@ class SubscribeSerializer(serializers.ModelSerializer):
 class FavoriteShoppingCartSerializer(serializers.ModelSerializer):
     id = serializers.ReadOnlyField(source='recipe.id')
     name = serializers.ReadOnlyField(source='recipe.name')
-    image = serializers.ImageField(
-        use_url=True,
-        allow_null=True,
-        required=False,
-        source='recipe.image',
-    )
+    image = RenditionImageField(rendition='thumbnail', source='recipe.image')
     cooking_time = serializers.ReadOnlyField(source='recipe.cooking_time')
 
     class Meta:
@@ -1,20 +1,104 @@
 import base64
+import binascii
+import hashlib
+import os
+from tempfile import SpooledTemporaryFile
 
-from django.core.files.base import ContentFile
-from recipes.models import Tag
+from django.conf import settings
+from django.core.files import File
+from recipes.models import Recipe, Tag
 from rest_framework import serializers
 
+from .images import (get_rendition_name, get_renditions_key,
+                     touch_stored_file)
+
+BASE64_CHUNK_SIZE = 64 * 1024
+
 
 class Base64ImageField(serializers.ImageField):
     """Кастомное поле сериализатора для
-    кодирования и декодирования c помощью base64."""
+    кодирования и декодирования c помощью base64.
+
+    Изображение декодируется по частям с ограничением размера
+    RECIPE_IMAGE_MAX_SIZE и сохраняется под именем из хэша содержимого,
+    поэтому повторная загрузка того же файла не создаёт копию.
+    Переносы строк и пробелы в base64 допускаются."""
+
+    default_error_messages = {
+        'too_large': 'Размер изображения не должен превышать {max_size} байт.',
+        'invalid_base64': 'Некорректные данные изображения.',
+    }
 
     def to_internal_value(self, data):
-        if isinstance(data, str) and data.startswith('data:image'):
+        if not (isinstance(data, str) and data.startswith('data:image')):
+            return super().to_internal_value(data)
+        try:
             format, imgstr = data.split(';base64,')
-            ext = format.split('/')[-1]
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
-        return super().to_internal_value(data)
+        except ValueError:
+            self.fail('invalid_base64')
+        ext = format.split('/')[-1]
+        imgstr = ''.join(imgstr.split())
+        max_size = settings.RECIPE_IMAGE_MAX_SIZE
+        if len(imgstr) * 3 // 4 - imgstr[-2:].count('=') > max_size:
+            self.fail('too_large', max_size=max_size)
+
+        hasher = hashlib.sha256()
+        buffer = SpooledTemporaryFile(max_size=BASE64_CHUNK_SIZE * 16)
+        try:
+            for start in range(0, len(imgstr), BASE64_CHUNK_SIZE):
+                chunk = base64.b64decode(
+                    imgstr[start:start + BASE64_CHUNK_SIZE], validate=True
+                )
+                hasher.update(chunk)
+                buffer.write(chunk)
+        except (binascii.Error, ValueError):
+            self.fail('invalid_base64')
+        buffer.seek(0)
+
+        name = f'{hasher.hexdigest()[:32]}.{ext}'
+        image = super().to_internal_value(File(buffer, name=name))
+        field = Recipe._meta.get_field('image')
+        stored_name = os.path.join(field.upload_to, name)
+        reused = touch_stored_file(field.storage, stored_name)
+        return stored_name if reused else image
+
+
+def get_image_url(image, rendition=None, request=None):
+    """Ссылка на изображение или на его уменьшенную копию rendition,
+    если копии уже созданы: это отмечено в image_renditions рецепта,
+    хранилище не опрашивается. Как у ImageField, ссылка абсолютная,
+    если передан request."""
+
+    if not image:
+        return None
+    if rendition and getattr(
+        image.instance, 'image_renditions', None
+    ) == get_renditions_key():
+        url = image.storage.url(get_rendition_name(image.name, rendition))
+    else:
+        try:
+            url = image.url
+        except AttributeError:
+            return None
+    return request.build_absolute_uri(url) if request else url
+
+
+class RenditionImageField(serializers.ImageField):
+    """Отдаёт ссылку на уменьшенную копию изображения, если она уже
+    создана. Размер задаётся аргументом rendition или ключом
+    image_rendition в контексте сериализатора."""
+
+    def __init__(self, rendition=None, **kwargs):
+        self.rendition = rendition
+        kwargs.setdefault('read_only', True)
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        return get_image_url(
+            value,
+            self.rendition or self.context.get('image_rendition'),
+            self.context.get('request'),
+        )
 
 
 class TagListField(serializers.ListField):
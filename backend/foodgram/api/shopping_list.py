@@ -0,0 +1,101 @@
+import csv
+import json
+from io import BytesIO
+
+from django.conf import settings
+from PIL import Image, ImageDraw, ImageFont
+from recipes.models import ShoppingCartIngredient
+
+TITLE = 'Cписок покупок: '
+
+PDF_PAGE_SIZE = (1240, 1754)
+PDF_RESOLUTION = 150.0
+PDF_MARGIN = 100
+PDF_FONT_SIZE = 28
+PDF_LINE_HEIGHT = 44
+
+
+def get_shopping_list(user):
+    """Суммарное количество каждого ингредиента из списка покупок
+    пользователя, по заранее посчитанным ShoppingCartIngredient."""
+
+    return ShoppingCartIngredient.objects.filter(
+        user=user
+    ).values_list(
+        'ingredient__name', 'ingredient__measurement_unit', 'amount'
+    ).order_by(
+        'ingredient__name', 'ingredient__measurement_unit'
+    ).iterator()
+
+
+def render_txt(ingredients):
+    yield f'{TITLE}\n'
+    for index, (name, unit, total) in enumerate(ingredients, start=1):
+        yield f'{index}. {name.capitalize()} ({unit}) - {total};\n'
+
+
+class Echo:
+    """Буфер для csv.writer, возвращающий записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+def render_csv(ingredients):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('name', 'measurement_unit', 'amount'))
+    for row in ingredients:
+        yield writer.writerow(row)
+
+
+def render_json(ingredients):
+    yield '['
+    for index, (name, unit, total) in enumerate(ingredients):
+        item = json.dumps(
+            {'name': name, 'measurement_unit': unit, 'amount': total},
+            ensure_ascii=False,
+        )
+        yield item if index == 0 else ',' + item
+    yield ']'
+
+
+def render_pdf(ingredients):
+    """PDF собирается из страниц-изображений формата A4,
+    на которых построчно отрисован список покупок."""
+
+    try:
+        font = ImageFont.truetype(settings.SHOPPING_LIST_FONT, PDF_FONT_SIZE)
+    except OSError:
+        font = ImageFont.load_default()
+    lines_per_page = (
+        (PDF_PAGE_SIZE[1] - 2 * PDF_MARGIN) // PDF_LINE_HEIGHT
+    )
+    pages = []
+    page = draw = None
+    for index, line in enumerate(render_txt(ingredients)):
+        if index % lines_per_page == 0:
+            page = Image.new('L', PDF_PAGE_SIZE, color=255)
+            draw = ImageDraw.Draw(page)
+            pages.append(page)
+        position = (
+            PDF_MARGIN,
+            PDF_MARGIN + (index % lines_per_page) * PDF_LINE_HEIGHT,
+        )
+        draw.text(position, line.rstrip('\n'), font=font, fill=0)
+    buffer = BytesIO()
+    pages[0].save(
+        buffer,
+        'PDF',
+        resolution=PDF_RESOLUTION,
+        save_all=True,
+        append_images=pages[1:],
+    )
+    yield buffer.getvalue()
+
+
+SHOPPING_LIST_FORMATS = {
+    'txt': ('text/plain; charset=utf-8', render_txt),
+    'csv': ('text/csv; charset=utf-8', render_csv),
+    'json': ('application/json', render_json),
+    'pdf': ('application/pdf', render_pdf),
+}
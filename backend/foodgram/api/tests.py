@@ -0,0 +1,618 @@
+import os
+from datetime import timedelta
+from contextlib import ExitStack
+from io import StringIO
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.files.storage import FileSystemStorage
+from django.core.management import CommandError, call_command
+from django.db import connection, connections
+from django.db.models import Count
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from recipes.models import (DataVersion, Favorite, Ingredient,
+                            IngredientRecipe, Recipe, RecipeSearchTerm,
+                            ShoppingCart, ShoppingCartIngredient, Tag,
+                            TagRecipe)
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APITestCase
+from users.models import Follow
+
+from .db import check_replica
+from .images import get_rendition_name, get_renditions_key
+from .renderers import CompactJSONRenderer
+from .serializers import (IngredientSerializer, RecipeViewSerializer,
+                          TagSerializer)
+from .views import IngredientViewSet, RecipeViewSet, TagViewSet
+
+User = get_user_model()
+
+
+class RecipeDataTestCase(APITestCase):
+    """Читатель, три автора с рецептами, избранное, список покупок
+    и подписка."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='reader',
+            email='reader@example.com',
+            first_name='Reader',
+            last_name='Reader',
+            password='reader-password',
+        )
+        authors = [
+            User.objects.create_user(
+                username=f'author{index}',
+                email=f'author{index}@example.com',
+                first_name='Author',
+                last_name=str(index),
+                password='author-password',
+            )
+            for index in range(3)
+        ]
+        tags = [
+            Tag.objects.create(
+                name=f'Тэг {index}', color=f'#00000{index}', slug=f'tag{index}'
+            )
+            for index in range(2)
+        ]
+        ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {index}', measurement_unit='г'
+            )
+            for index in range(5)
+        ]
+        for index in range(12):
+            recipe = Recipe.objects.create(
+                author=authors[index % len(authors)],
+                name=f'Рецепт {index}',
+                text='Описание',
+                cooking_time=10,
+            )
+            TagRecipe.objects.create(recipe=recipe, tag=tags[index % 2])
+            for ingredient in ingredients[:index % 4 + 2]:
+                IngredientRecipe.objects.create(
+                    recipe=recipe, ingredient=ingredient, amount=index + 1
+                )
+            if index % 2:
+                Favorite.objects.create(user=cls.user, recipe=recipe)
+            if index % 3:
+                ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+        Follow.objects.create(user=cls.user, author=authors[0])
+
+
+class RecipeListQueriesTest(RecipeDataTestCase):
+    """Число запросов страницы рецептов не зависит от её размера."""
+
+    def setUp(self):
+        caches[settings.RECIPE_LIST_CACHE].clear()
+
+    def assert_list_queries(self, queries):
+        for limit in (1, 6, 12):
+            with self.subTest(limit=limit):
+                with self.assertNumQueries(queries):
+                    response = self.client.get(
+                        '/api/recipes/', {'limit': limit}
+                    )
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.data['results']), limit)
+
+    def test_anonymous_list(self):
+        self.assert_list_queries(5)
+
+    def test_authenticated_list(self):
+        self.client.force_authenticate(self.user)
+        self.assert_list_queries(7)
+
+
+class ReadSerializersTest(RecipeDataTestCase):
+    """Ответы RecipeReadSerializer, TagReadSerializer и
+    IngredientReadSerializer с CompactJSONRenderer байт в байт
+    совпадают с ответами ModelSerializer и JSONRenderer."""
+
+    reference = (
+        (RecipeViewSet, 'get_serializer_class',
+         lambda view: RecipeViewSerializer),
+        (TagViewSet, 'serializer_class', TagSerializer),
+        (IngredientViewSet, 'serializer_class', IngredientSerializer),
+        (RecipeViewSet, 'renderer_classes', [JSONRenderer]),
+        (TagViewSet, 'renderer_classes', [JSONRenderer]),
+        (IngredientViewSet, 'renderer_classes', [JSONRenderer]),
+    )
+
+    def get_content(self, path, reference=False):
+        caches[settings.RECIPE_LIST_CACHE].clear()
+        with ExitStack() as stack:
+            if reference:
+                for view, name, value in self.reference:
+                    stack.enter_context(patch.object(view, name, value))
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        self.assertIsInstance(
+            response.accepted_renderer,
+            JSONRenderer if reference else CompactJSONRenderer,
+        )
+        return response.content
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        Recipe.objects.filter(name='Рецепт 0').update(
+            image='recipes/images/test.jpg'
+        )
+
+    def assert_identical(self):
+        recipe = Recipe.objects.get(name='Рецепт 0')
+        for path in (
+            '/api/recipes/',
+            '/api/recipes/?limit=12',
+            f'/api/recipes/{recipe.id}/',
+            '/api/tags/',
+            '/api/ingredients/',
+        ):
+            with self.subTest(path=path):
+                self.assertEqual(
+                    self.get_content(path),
+                    self.get_content(path, reference=True),
+                )
+        self.assertIn(
+            b'recipes/images/test.jpg',
+            self.get_content(f'/api/recipes/{recipe.id}/'),
+        )
+
+    def test_anonymous(self):
+        self.assert_identical()
+
+    def test_authenticated(self):
+        self.client.force_authenticate(self.user)
+        self.assert_identical()
+
+
+class RenditionsTest(RecipeDataTestCase):
+    """Ссылки на уменьшенные копии строятся по отметке в рецепте,
+    недостающие копии создаёт make_renditions."""
+
+    image_name = 'recipes/images/test.png'
+
+    def setUp(self):
+        media = TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        os.makedirs(os.path.join(media.name, 'recipes', 'images'))
+        Image.new('RGB', (1200, 900), 'red').save(
+            os.path.join(media.name, self.image_name)
+        )
+        self.media_root = media.name
+        Recipe.objects.filter(name='Рецепт 0').update(image=self.image_name)
+
+    def get_list_image(self):
+        caches[settings.RECIPE_LIST_CACHE].clear()
+        with patch.object(
+            FileSystemStorage, 'exists', side_effect=AssertionError
+        ):
+            response = self.client.get('/api/recipes/', {'limit': 12})
+        self.assertEqual(response.status_code, 200)
+        images = [
+            recipe['image'] for recipe in response.data['results']
+            if recipe['image']
+        ]
+        self.assertEqual(len(images), 1)
+        return images[0]
+
+    def test_make_renditions(self):
+        self.assertTrue(self.get_list_image().endswith(self.image_name))
+        out = StringIO()
+        call_command('make_renditions', stdout=out)
+        self.assertIn('Изображений с копиями: 1, ошибок: 0', out.getvalue())
+        self.assertEqual(
+            Recipe.objects.get(name='Рецепт 0').image_renditions,
+            get_renditions_key(),
+        )
+        rendition = get_rendition_name(self.image_name, 'medium')
+        self.assertTrue(
+            os.path.exists(os.path.join(self.media_root, rendition))
+        )
+        self.assertTrue(self.get_list_image().endswith(rendition))
+        out = StringIO()
+        call_command('make_renditions', stdout=out)
+        self.assertIn('Изображений с копиями: 0', out.getvalue())
+
+
+class ShoppingTotalsTest(RecipeDataTestCase):
+    """Суммы списков покупок остаются верными при изменениях
+    не через API: из админки, ORM и каскадном удалении."""
+
+    def setUp(self):
+        for author in User.objects.filter(username__startswith='author'):
+            for recipe in Recipe.objects.exclude(author=author)[:4]:
+                ShoppingCart.objects.create(user=author, recipe=recipe)
+
+    def assert_totals(self):
+        self.assertEqual(
+            set(ShoppingCartIngredient.objects.values_list(
+                'user', 'ingredient', 'amount'
+            )),
+            set(ShoppingCartIngredient.objects.live_totals()),
+        )
+
+    def test_orm_changes(self):
+        self.assert_totals()
+        ShoppingCart.objects.filter(user=self.user).first().delete()
+        self.assert_totals()
+        ShoppingCart.objects.filter(recipe__name__endswith='1').delete()
+        self.assert_totals()
+        Recipe.objects.filter(shoppings__isnull=False).first().delete()
+        self.assert_totals()
+        Recipe.objects.filter(name__in=('Рецепт 4', 'Рецепт 5')).delete()
+        self.assert_totals()
+        User.objects.get(username='author0').delete()
+        self.assert_totals()
+        ShoppingCart.objects.create(
+            user=self.user,
+            recipe=Recipe.objects.exclude(shoppings__user=self.user).first(),
+        )
+        self.assert_totals()
+        self.assertTrue(ShoppingCartIngredient.objects.exists())
+
+
+class RecipeCountersTest(RecipeDataTestCase):
+    """Счётчики избранного и списков покупок рецепта меняются
+    при любом способе изменения связей."""
+
+    def assert_counters(self):
+        recipes = Recipe.objects.annotate(
+            live_favorites=Count('favorites', distinct=True),
+            live_carts=Count('shoppings', distinct=True),
+        )
+        for recipe in recipes:
+            with self.subTest(recipe=recipe.name):
+                self.assertEqual(recipe.favorites_count, recipe.live_favorites)
+                self.assertEqual(recipe.carts_count, recipe.live_carts)
+
+    def test_counters(self):
+        self.assert_counters()
+        recipe = Recipe.objects.exclude(favorites__user=self.user).first()
+        self.client.force_authenticate(self.user)
+        response = self.client.post(f'/api/recipes/{recipe.id}/favorite/')
+        self.assertEqual(response.status_code, 201)
+        self.assert_counters()
+        Favorite.objects.filter(user=self.user).first().delete()
+        ShoppingCart.objects.filter(recipe__name__endswith='1').delete()
+        self.assert_counters()
+        author = User.objects.get(username='author1')
+        Favorite.objects.create(user=author, recipe=recipe)
+        ShoppingCart.objects.create(user=author, recipe=recipe)
+        self.assert_counters()
+        author.delete()
+        self.assert_counters()
+
+
+class RecipeIngredientIdsTest(RecipeDataTestCase):
+    """Recipe.ingredient_ids совпадает с IngredientRecipe после пересчёта,
+    создания и изменения рецепта и удаления ингредиента."""
+
+    def assert_ingredient_ids(self):
+        for recipe in Recipe.objects.all():
+            with self.subTest(recipe=recipe.name):
+                self.assertEqual(recipe.ingredient_ids, sorted(
+                    IngredientRecipe.objects.filter(
+                        recipe=recipe
+                    ).values_list('ingredient_id', flat=True)
+                ))
+
+    def test_ingredient_ids(self):
+        call_command('recipe_counters', stdout=StringIO())
+        self.assert_ingredient_ids()
+        ingredients = list(Ingredient.objects.order_by('id'))
+        self.client.force_authenticate(User.objects.get(username='author0'))
+        response = self.client.post('/api/recipes/', {
+            'name': 'Новый рецепт',
+            'text': 'Описание',
+            'cooking_time': 10,
+            'tags': [Tag.objects.first().id],
+            'ingredients': [
+                {'id': ingredient.id, 'amount': 10}
+                for ingredient in ingredients[3:]
+            ],
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assert_ingredient_ids()
+        response = self.client.patch(
+            f'/api/recipes/{response.data["id"]}/',
+            {'ingredients': [{'id': ingredients[0].id, 'amount': 10}]},
+            format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assert_ingredient_ids()
+        ingredients[1].delete()
+        self.assert_ingredient_ids()
+
+    def test_by_ingredients(self):
+        call_command('recipe_counters', stdout=StringIO())
+        pantry = set(Ingredient.objects.order_by('id').values_list(
+            'id', flat=True
+        )[:3])
+        response = self.client.get(
+            '/api/recipes/by-ingredients/',
+            {'ingredients': ','.join(map(str, pantry)), 'limit': 20},
+        )
+        self.assertEqual(response.status_code, 200)
+        expected = sorted(
+            (
+                recipe for recipe in Recipe.objects.all()
+                if pantry & set(recipe.ingredient_ids)
+            ),
+            key=lambda recipe: (
+                len(set(recipe.ingredient_ids) - pantry),
+                -recipe.pub_date.timestamp(),
+                -recipe.id,
+            ),
+        )
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data['results']],
+            [recipe.id for recipe in expected],
+        )
+
+
+class ImportDataTest(APITestCase):
+    """Строки с незаполненными или отсутствующими полями пропускаются
+    и учитываются, не прерывая импорт."""
+
+    def import_file(self, name, content):
+        with TemporaryDirectory() as directory:
+            path = os.path.join(directory, name)
+            with open(path, 'w', encoding='utf8') as file:
+                file.write(content)
+            out = StringIO()
+            call_command('import_data', path, stdout=out)
+            self.assertFalse(os.path.exists(f'{path}.progress'))
+        return out.getvalue()
+
+    def test_short_csv_rows(self):
+        out = self.import_file(
+            'ingredients.csv',
+            'name,measurement_unit\n'
+            'соль,г\n'
+            'перец\n'
+            'сахар,г\n',
+        )
+        self.assertIn('пропущено с незаполненными полями: 1', out)
+        self.assertEqual(
+            set(Ingredient.objects.values_list('name', flat=True)),
+            {'соль', 'сахар'},
+        )
+
+    def test_json_missing_fields(self):
+        out = self.import_file(
+            'tags.json',
+            '[{"name": "Завтрак", "color": "#ff0000", "slug": "breakfast"},'
+            ' {"name": "Обед", "color": "#00ff00"},'
+            ' ["Ужин", "#0000ff", "dinner"],'
+            ' {"name": "Ужин", "slug": "dinner", "color": null}]',
+        )
+        self.assertIn('пропущено с незаполненными полями: 2', out)
+        self.assertEqual(
+            set(Tag.objects.values_list('slug', 'color')),
+            {('breakfast', '#ff0000'), ('dinner', None)},
+        )
+
+
+class RecipeUpdateWritesTest(APITestCase):
+    """Изменение рецепта пишет только отличающиеся связи."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author',
+            email='author@example.com',
+            first_name='Author',
+            last_name='Author',
+            password='author-password',
+        )
+        cls.tag = Tag.objects.create(
+            name='Обед', color='#00ff00', slug='lunch'
+        )
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {index}', measurement_unit='г'
+            )
+            for index in range(2)
+        ]
+        cls.recipe = Recipe.objects.create(
+            author=cls.author,
+            name='Рецепт',
+            text='Описание',
+            cooking_time=10,
+            ingredients_count=len(cls.ingredients),
+        )
+        TagRecipe.objects.create(recipe=cls.recipe, tag=cls.tag)
+        for ingredient in cls.ingredients:
+            IngredientRecipe.objects.create(
+                recipe=cls.recipe, ingredient=ingredient, amount=100
+            )
+
+    def setUp(self):
+        self.client.force_authenticate(self.author)
+
+    def get_payload(self, amounts=(100, 100)):
+        return {
+            'name': 'Новое название',
+            'text': 'Описание',
+            'cooking_time': 10,
+            'tags': [self.tag.id],
+            'ingredients': [
+                {'id': ingredient.id, 'amount': amount}
+                for ingredient, amount in zip(self.ingredients, amounts)
+            ],
+        }
+
+    def patch(self, payload):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.patch(
+                f'/api/recipes/{self.recipe.id}/', payload, format='json'
+            )
+        self.assertEqual(response.status_code, 200)
+        return [query['sql'] for query in context.captured_queries]
+
+    @staticmethod
+    def get_writes(queries, model, statements=('INSERT', 'UPDATE', 'DELETE')):
+        table = connection.ops.quote_name(model._meta.db_table)
+        return [
+            sql for sql in queries
+            if sql.startswith(statements) and table in sql
+        ]
+
+    def test_title_only(self):
+        for payload in ({'name': 'Новое название'}, self.get_payload()):
+            with self.subTest(payload=payload):
+                queries = self.patch(payload)
+                self.assertEqual(
+                    self.get_writes(queries, IngredientRecipe), []
+                )
+                self.assertEqual(self.get_writes(queries, TagRecipe), [])
+                versions = self.get_writes(queries, DataVersion, ('UPDATE',))
+                self.assertEqual(len(versions), 2)
+
+    def test_create(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(
+                '/api/recipes/', self.get_payload(), format='json'
+            )
+        self.assertEqual(response.status_code, 201)
+        queries = [query['sql'] for query in context.captured_queries]
+        self.assertEqual(
+            len(self.get_writes(queries, RecipeSearchTerm, ('DELETE',))), 1
+        )
+        versions = self.get_writes(queries, DataVersion, ('UPDATE',))
+        self.assertEqual(len(versions), 2)
+        self.assertTrue(RecipeSearchTerm.objects.filter(
+            recipe_id=response.data['id'], term='ингредиент'
+        ).exists())
+
+    def test_amount_change(self):
+        queries = self.patch(self.get_payload(amounts=(150, 100)))
+        writes = self.get_writes(queries, IngredientRecipe)
+        self.assertEqual(len(writes), 1)
+        self.assertTrue(writes[0].startswith('UPDATE'))
+        versions = self.get_writes(queries, DataVersion, ('UPDATE',))
+        self.assertEqual(len(versions), 2)
+        self.assertEqual(
+            IngredientRecipe.objects.get(
+                recipe=self.recipe, ingredient=self.ingredients[0]
+            ).amount,
+            150,
+        )
+
+
+class PaginationCommandsTest(RecipeDataTestCase):
+    """Команды замеров, использующие KeysetPagination напрямую."""
+
+    def test_explain_filters(self):
+        out = StringIO()
+        try:
+            call_command('explain_filters', stdout=out)
+        except CommandError as error:
+            # На маленькой SQLite-базе полное чтение таблиц допустимо.
+            self.assertIn('Планов с полным чтением таблиц', str(error))
+        self.assertIn("'cursor': True", out.getvalue())
+
+    def test_bench_feed(self):
+        out = StringIO()
+        call_command(
+            'bench_feed',
+            authors=20,
+            recipes=200,
+            follows=[5],
+            pages=[1, 3],
+            repeat=1,
+            stdout=out,
+        )
+        self.assertIn('page    3', out.getvalue())
+
+
+@override_settings(API_METRICS_ENABLED=True)
+class MetricsAccessTest(APITestCase):
+    """Метрики не отдаются без токена или прав администратора."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(
+            username='admin',
+            email='admin@example.com',
+            first_name='Admin',
+            last_name='Admin',
+            password='admin-password',
+        )
+
+    @override_settings(API_METRICS_TOKEN='')
+    def test_without_token(self):
+        self.assertEqual(self.client.get('/api/metrics/').status_code, 403)
+        self.client.force_login(self.admin)
+        self.assertEqual(self.client.get('/api/metrics/').status_code, 200)
+
+    @override_settings(API_METRICS_TOKEN='secret')
+    def test_with_token(self):
+        self.client.force_login(self.admin)
+        self.assertEqual(self.client.get('/api/metrics/').status_code, 403)
+        response = self.client.get(
+            '/api/metrics/', HTTP_AUTHORIZATION='Bearer secret'
+        )
+        self.assertEqual(response.status_code, 200)
+
+
+@override_settings(REPLICA_MAX_LAG=5)
+class ReplicaLagTest(APITestCase):
+    """Отставание реплики считается по последнему изменению,
+    которое она получила, а не по последнему изменению основной БД."""
+
+    replica = 'replica_lag_test'
+
+    def setUp(self):
+        connections.databases[self.replica] = {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': ':memory:',
+        }
+        self.addCleanup(self.drop_replica)
+        with connections[self.replica].schema_editor() as editor:
+            editor.create_model(DataVersion)
+
+    def drop_replica(self):
+        connections[self.replica].close()
+        del connections[self.replica]
+        del connections.databases[self.replica]
+
+    def set_modified(self, alias, seconds_ago):
+        DataVersion.objects.using(alias).update_or_create(
+            name='recipes', defaults={'version': 1}
+        )
+        DataVersion.objects.using(alias).update(
+            modified=timezone.now() - timedelta(seconds=seconds_ago)
+        )
+
+    def test_replica_up_to_date(self):
+        self.set_modified('default', 3600)
+        self.set_modified(self.replica, 3600)
+        self.assertTrue(check_replica(self.replica))
+
+    def test_replica_stalled_under_steady_writes(self):
+        self.set_modified('default', 0)
+        self.set_modified(self.replica, 2 * 3600)
+        self.assertFalse(check_replica(self.replica))
+
+    def test_replica_slightly_behind(self):
+        self.set_modified('default', 0)
+        self.set_modified(self.replica, 1)
+        self.assertTrue(check_replica(self.replica))
+
+    def test_replica_without_changes(self):
+        self.set_modified('default', 0)
+        self.assertFalse(check_replica(self.replica))
@@ -1,6 +1,7 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
+from .metrics import metrics_view
 from .views import (CustomUserViewSet, IngredientViewSet, RecipeViewSet,
                     TagViewSet)
 
@@ -12,6 +13,7 @@ v1_router.register('recipes', RecipeViewSet, basename='recipes')
 
 
 urlpatterns = [
+    path('metrics/', metrics_view, name='metrics'),
     path('', include(v1_router.urls)),
     path('', include('djoser.urls')),
     path('auth/', include('djoser.urls.authtoken')),
@@ -1,27 +1,38 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.db.models import Count, Prefetch
+from django.http import StreamingHttpResponse
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
 from recipes.models import (Favorite, Ingredient, IngredientRecipe, Recipe,
                             ShoppingCart, Tag)
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import JSONParser
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 from users.models import Follow
-from .common import add_del_obj_action
+from .bulk import NDJSONParser, export_recipes, import_recipes
+from .cache import recipe_list_cache
+from .common import (add_del_obj_action, get_recipes_limit,
+                     prefetch_latest_recipes, rank_by_ingredients)
+from .conditional import ConditionalGetMixin
 from .filters import IngredientFilter, RecipeAnonymousFilters, RecipeFilters
-from .pagination import CustomPagination
+from .ingredient_index import ingredient_index
+from .pagination import (CustomPagination, FeedPagination,
+                         KeysetPaginationMixin, RecipeKeysetPagination)
 from .permissions import AdminOrReadOnly, OwnerOrReadOnly
-from .serializers import (FavoriteSerializer, IngredientSerializer,
+from .serializers import (FavoriteSerializer, IngredientReadSerializer,
+                          RecipeReadSerializer, RecipeSerializer,
                           ShoppingCartSerializer, SubscribeSerializer,
-                          TagSerializer)
+                          TagReadSerializer)
+from .shopping_list import SHOPPING_LIST_FORMATS, get_shopping_list
 
 User = get_user_model()
 
 
-class CustomUserViewSet(UserViewSet):
+class CustomUserViewSet(KeysetPaginationMixin, UserViewSet):
     pagination_class = CustomPagination
 
     def get_queryset(self):
@@ -46,7 +57,15 @@ class CustomUserViewSet(UserViewSet):
         permission_classes=(IsAuthenticated,),
     )
     def subscriptions(self, request):
-        followers = self.paginate_queryset(request.user.followers.all())
+        followers = self.paginate_queryset(
+            request.user.followers.select_related('author').annotate(
+                recipes_count=Count('author__recipes')
+            )
+        )
+        prefetch_latest_recipes(
+            [follow.author for follow in followers],
+            get_recipes_limit(request),
+        )
         serializer = SubscribeSerializer(
             followers,
             many=True,
@@ -72,36 +91,171 @@ class CustomUserViewSet(UserViewSet):
         )
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
-    serializer_class = TagSerializer
+class TagViewSet(ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
+    version_names = ('tags',)
+    serializer_class = TagReadSerializer
     queryset = Tag.objects.all()
     permission_classes = (AdminOrReadOnly,)
     pagination_class = None
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
-    serializer_class = IngredientSerializer
+class IngredientViewSet(ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
+    version_names = ('ingredients',)
+    serializer_class = IngredientReadSerializer
     queryset = Ingredient.objects.all()
     permission_classes = (AdminOrReadOnly,)
     filter_backends = (DjangoFilterBackend,)
     filterset_class = IngredientFilter
     pagination_class = None
 
+    def filter_queryset(self, queryset):
+        name = self.request.query_params.get('name')
+        if self.action != 'list' or not name:
+            return super().filter_queryset(queryset)
+        return ingredient_index.search(
+            name,
+            measurement_unit=self.request.query_params.get('measurement_unit'),
+            limit=settings.INGREDIENT_SEARCH_LIMIT,
+        )
+
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(
+    KeysetPaginationMixin, ConditionalGetMixin, viewsets.ModelViewSet
+):
+    conditional_actions = ('retrieve',)
+    version_names = ('recipes', 'tags', 'ingredients', 'users')
+    user_versioned = True
     queryset = Recipe.objects.all()
+    serializer_class = RecipeSerializer
     permission_classes = (OwnerOrReadOnly,)
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilters
     pagination_class = CustomPagination
+    keyset_pagination_class = RecipeKeysetPagination
+    read_actions = ('list', 'retrieve', 'feed', 'by_ingredients')
+
+    def get_serializer_class(self):
+        if self.action in self.read_actions and self.request.method == 'GET':
+            return RecipeReadSerializer
+        return super().get_serializer_class()
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.action == 'list':
+            context['image_rendition'] = 'medium'
+        return context
+
+    def list(self, request, *args, **kwargs):
+        if not request.user.is_anonymous:
+            return super().list(request, *args, **kwargs)
+        return recipe_list_cache.get_response(
+            request, super().list, *args, **kwargs
+        )
+
+    @action(
+        methods=['get'],
+        detail=False,
+        permission_classes=(IsAdminUser,),
+    )
+    def cache_stats(self, request):
+        return Response(recipe_list_cache.stats())
+
+    @action(
+        methods=['get'],
+        detail=False,
+        permission_classes=(IsAuthenticated,),
+    )
+    def feed(self, request):
+        """Рецепты всех авторов из подписок, от новых к старым,
+        с пагинацией по ключу (?cursor=...&limit=...)."""
+
+        paginator = FeedPagination()
+        page = paginator.paginate_queryset(
+            self.get_queryset(), request, view=self
+        )
+        serializer = self.get_serializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(methods=['get'], detail=False, url_path='by-ingredients')
+    def by_ingredients(self, request):
+        """Что можно приготовить из ингредиентов ?ingredients=1,2,3:
+        сначала рецепты, для которых есть всё, затем по числу
+        недостающих ингредиентов. Остальные фильтры тоже применяются."""
+
+        try:
+            ingredient_ids = {
+                int(value)
+                for param in request.query_params.getlist('ingredients')
+                for value in param.split(',') if value
+            }
+        except ValueError:
+            raise ValidationError(
+                {'ingredients': 'Ожидаются id ингредиентов через запятую'}
+            )
+        if not ingredient_ids:
+            raise ValidationError({'ingredients': 'Укажите ингредиенты'})
+        if len(ingredient_ids) > settings.COOK_MAX_INGREDIENTS:
+            raise ValidationError({'ingredients': (
+                f'Не больше {settings.COOK_MAX_INGREDIENTS} ингредиентов'
+            )})
+        queryset = rank_by_ingredients(
+            self.filter_queryset(self.get_queryset()), ingredient_ids
+        )
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(
+        methods=['post'],
+        detail=False,
+        url_path='import',
+        permission_classes=(IsAdminUser,),
+        parser_classes=(NDJSONParser, JSONParser),
+    )
+    def bulk_import(self, request):
+        records = request.data
+        if isinstance(records, dict):
+            records = (records,)
+        report = import_recipes(
+            records, request.user, settings.RECIPE_IMPORT_BATCH_SIZE
+        )
+        if report['errors'] and not report['created']:
+            return Response(report, status=status.HTTP_400_BAD_REQUEST)
+        return Response(report, status=status.HTTP_201_CREATED)
+
+    @action(
+        methods=['get'],
+        detail=False,
+        permission_classes=(IsAdminUser,),
+    )
+    def export(self, request):
+        response = StreamingHttpResponse(
+            export_recipes(self.filter_queryset(self.get_queryset())),
+            content_type='application/x-ndjson; charset=utf-8',
+        )
+        response['Content-Disposition'] = (
+            'attachment; filename="recipes.ndjson"'
+        )
+        return response
 
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
     def get_queryset(self):
+        """Все данные для сериализации страницы рецептов загружаются
+        фиксированным числом запросов, независимо от её размера."""
+
         if self.request.user.is_anonymous:
             self.filterset_class = RecipeAnonymousFilters
-        return super().get_queryset()
+        return super().get_queryset().select_related(
+            'author'
+        ).prefetch_related(
+            'tag',
+            Prefetch(
+                'recipes',
+                queryset=IngredientRecipe.objects.select_related('ingredient'),
+            ),
+        )
 
     @action(
         methods=['post', 'delete'],
@@ -127,22 +281,20 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
     )
     def download_shopping_cart(self, request):
-        user = request.user
-        text = 'Cписок покупок: \n'
-
-        shopping_cart = IngredientRecipe.objects.filter(
-            recipe_id__in=user.shoppings.values_list('recipe_id', flat=True)
-        ).values_list(
-            'ingredient__name', 'ingredient__measurement_unit'
-        ).annotate(Sum('amount'))
+        file_format = request.query_params.get('type', 'txt')
+        if file_format not in SHOPPING_LIST_FORMATS:
+            raise ValidationError(
+                {'type': f'Доступные форматы: '
+                         f'{", ".join(SHOPPING_LIST_FORMATS)}'}
+            )
+        content_type, render = SHOPPING_LIST_FORMATS[file_format]
 
-        for index, ingredient in enumerate(sorted(shopping_cart), start=1):
-            text += f'{index}. {ingredient[0].capitalize()} ' \
-                    f'({ingredient[1]}) - {ingredient[2]};\n'
-
-        response = HttpResponse(text, content_type='text/plain')
+        response = StreamingHttpResponse(
+            render(get_shopping_list(request.user)),
+            content_type=content_type,
+        )
         response['Content-Disposition'] = (
-            'attachment; filename="shopping-list.txt"'
+            f'attachment; filename="shopping-list.{file_format}"'
         )
 
         return response
@@ -1,7 +1,14 @@
 import os
 
-from django.core.asgi import get_asgi_application
+import django
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
 
+
+def get_asgi_application():
+    django.setup(set_prefix=False)
+    from api.asgi import ASGIHandler
+    return ASGIHandler()
+
+
 application = get_asgi_application()
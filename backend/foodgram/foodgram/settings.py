@@ -37,6 +37,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.metrics.MetricsMiddleware',
+    'api.db.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -46,6 +48,14 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+API_METRICS_ENABLED = (
+    os.getenv('API_METRICS_ENABLED', default='False') == 'True'
+)
+API_METRICS_N_PLUS_ONE_THRESHOLD = int(
+    os.getenv('API_METRICS_N_PLUS_ONE_THRESHOLD', default=10)
+)
+API_METRICS_TOKEN = os.getenv('API_METRICS_TOKEN', default='')
+
 ROOT_URLCONF = 'foodgram.urls'
 
 AUTH_USER_MODEL = 'users.CustomUser'
@@ -69,6 +79,12 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'foodgram.wsgi.application'
 
+ASGI_THREADS = int(os.getenv('ASGI_THREADS', default=8))
+ASGI_READ_THREADS = int(os.getenv('ASGI_READ_THREADS', default=16))
+# Сколько частей ответа поток может передать циклу событий вперёд
+# медленного клиента, прежде чем будет ждать отправки.
+ASGI_RESPONSE_BUFFER = int(os.getenv('ASGI_RESPONSE_BUFFER', default=16))
+
 
 DATABASES = {
     'default': {
@@ -80,9 +96,67 @@ DATABASES = {
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', default='postgres'),
         'HOST': os.getenv('DB_HOST', default='db'),
         'PORT': os.getenv('DB_PORT', default='5432'),
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', default=60)),
+        # За внешним пулером в режиме транзакций (PgBouncer) именованные
+        # курсоры .iterator() не переживают смену соединения сервера.
+        'DISABLE_SERVER_SIDE_CURSORS': (
+            os.getenv('DB_EXTERNAL_POOLER', default='False') == 'True'
+        ),
     }
 }
 
+if DATABASES['default']['ENGINE'] == 'django.db.backends.postgresql':
+    DATABASES['default']['OPTIONS'] = {
+        'connect_timeout': int(os.getenv('DB_CONNECT_TIMEOUT', default=5)),
+    }
+
+# Реплики для чтения: имена файлов для SQLite, иначе хост[:порт]
+# с теми же учётными данными, что у основной БД.
+REPLICA_DATABASES = []
+DB_REPLICAS = os.getenv('DB_REPLICAS', default='').split()
+for index, location in enumerate(DB_REPLICAS):
+    replica = dict(DATABASES['default'], TEST={'MIRROR': 'default'})
+    if replica['ENGINE'] == 'django.db.backends.sqlite3':
+        replica['NAME'] = location
+    else:
+        host, _, port = location.partition(':')
+        replica.update(HOST=host, PORT=port or replica['PORT'])
+    DATABASES[f'replica_{index}'] = replica
+    REPLICA_DATABASES.append(f'replica_{index}')
+
+if REPLICA_DATABASES:
+    DATABASE_ROUTERS = ['api.db.ReplicaRouter']
+
+REPLICA_STICKY_SECONDS = int(
+    os.getenv('REPLICA_STICKY_SECONDS', default=10)
+)
+REPLICA_MAX_LAG = float(os.getenv('REPLICA_MAX_LAG', default=5))
+REPLICA_LAG_CHECK_INTERVAL = float(
+    os.getenv('REPLICA_LAG_CHECK_INTERVAL', default=5)
+)
+
+DB_HEALTH_CHECK_INTERVAL = int(
+    os.getenv('DB_HEALTH_CHECK_INTERVAL', default=30)
+)
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'recipe_list': {
+        'BACKEND': os.getenv(
+            'RECIPE_LIST_CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache',
+        ),
+        'LOCATION': os.getenv(
+            'RECIPE_LIST_CACHE_LOCATION', default='recipe-list'
+        ),
+        'TIMEOUT': int(os.getenv('RECIPE_LIST_CACHE_TIMEOUT', default=300)),
+    },
+}
+
+RECIPE_LIST_CACHE = 'recipe_list'
+
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -108,6 +182,10 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.TokenAuthentication',
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.CompactJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 6,
 }
@@ -143,4 +221,37 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+RECIPE_IMAGE_MAX_SIZE = int(
+    os.getenv('RECIPE_IMAGE_MAX_SIZE', default=5 * 1024 * 1024)
+)
+RECIPE_IMAGE_RENDITION_FORMAT = os.getenv(
+    'RECIPE_IMAGE_RENDITION_FORMAT', default='WEBP'
+)
+RECIPE_IMAGE_RENDITIONS = {
+    'thumbnail': (300, 300),
+    'medium': (800, 800),
+}
+RECIPE_IMAGE_WORKERS = int(os.getenv('RECIPE_IMAGE_WORKERS', default=2))
+
+SUBSCRIPTION_RECIPES_LIMIT = int(
+    os.getenv('SUBSCRIPTION_RECIPES_LIMIT', default=50)
+)
+
+INGREDIENT_SEARCH_LIMIT = int(
+    os.getenv('INGREDIENT_SEARCH_LIMIT', default=50)
+)
+
+RECIPE_SEARCH_CONFIG = os.getenv('RECIPE_SEARCH_CONFIG', default='russian')
+
+COOK_MAX_INGREDIENTS = int(os.getenv('COOK_MAX_INGREDIENTS', default=100))
+
+RECIPE_IMPORT_BATCH_SIZE = int(
+    os.getenv('RECIPE_IMPORT_BATCH_SIZE', default=500)
+)
+
+SHOPPING_LIST_FONT = os.getenv(
+    'SHOPPING_LIST_FONT',
+    default='/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf',
+)
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
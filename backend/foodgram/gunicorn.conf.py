@@ -0,0 +1,9 @@
+import os
+
+bind = '0:8000'
+workers = int(os.getenv('GUNICORN_WORKERS', default=1))
+
+# SERVER_MODE=asgi: foodgram.asgi под воркерами uvicorn,
+# иначе foodgram.wsgi под синхронными воркерами.
+if os.getenv('SERVER_MODE', default='wsgi') == 'asgi':
+    worker_class = 'uvicorn.workers.UvicornWorker'
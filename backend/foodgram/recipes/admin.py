@@ -16,7 +16,7 @@ class RecipeAdmin(admin.ModelAdmin):
     list_filter = ('name', 'author', 'tag')
 
     def favorites(self, obj):
-        return Favorite.objects.filter(recipe=obj.id).count()
+        return obj.favorites_count
 
 
 @admin.register(Ingredient)
@@ -0,0 +1,228 @@
+import csv
+import json
+import os
+from io import StringIO
+from itertools import islice
+
+from django.db import connection, transaction
+
+from .models import DataVersion, Ingredient, Tag
+
+JSON_READ_SIZE = 64 * 1024
+
+
+def get_file_format(path):
+    """Формат файла по расширению: csv, json или ndjson."""
+
+    extension = os.path.splitext(path)[1].lower().lstrip('.')
+    if extension in ('ndjson', 'jsonl'):
+        return 'ndjson'
+    return extension
+
+
+def iter_csv(file, fields):
+    """Строки CSV в виде словарей. Первая строка считается заголовком,
+    если совпадает с названиями полей, иначе колонки идут в порядке
+    fields."""
+
+    reader = csv.reader(file)
+    first = next(reader, None)
+    if first is None:
+        return
+    header = fields
+    if set(first) >= set(fields):
+        header = first
+    else:
+        yield dict(zip(header, first))
+    for row in reader:
+        yield dict(zip(header, row))
+
+
+def iter_ndjson(file, fields=None):
+    for line in file:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def iter_json(file, fields=None):
+    """Элементы JSON-массива верхнего уровня без чтения файла целиком."""
+
+    decoder = json.JSONDecoder()
+    buffer = file.read(JSON_READ_SIZE).lstrip()
+    if not buffer.startswith('['):
+        raise ValueError('Ожидается JSON-массив')
+    buffer = buffer[1:]
+    while True:
+        buffer = buffer.lstrip().lstrip(',').lstrip()
+        if buffer.startswith(']'):
+            return
+        try:
+            item, end = decoder.raw_decode(buffer)
+        except ValueError:
+            chunk = file.read(JSON_READ_SIZE)
+            if not chunk:
+                raise
+            buffer += chunk
+            continue
+        yield item
+        buffer = buffer[end:]
+        if len(buffer) < JSON_READ_SIZE:
+            buffer += file.read(JSON_READ_SIZE)
+
+
+READERS = {
+    'csv': iter_csv,
+    'json': iter_json,
+    'ndjson': iter_ndjson,
+}
+
+
+def iter_rows(file, file_format, fields):
+    if file_format not in READERS:
+        raise ValueError(f'Неподдерживаемый формат: {file_format}')
+    return READERS[file_format](file, fields)
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class Upserter:
+    """Загрузка пакета строк с обновлением по естественному ключу.
+
+    В PostgreSQL пакет передаётся через COPY во временную таблицу
+    и переносится одним INSERT ... ON CONFLICT, в остальных СУБД
+    используются bulk_create и bulk_update.
+    """
+
+    model = None
+    fields = ()
+    key = ()
+    version_name = None
+
+    def clean(self, row):
+        """Значения полей без пробелов по краям. None, если не заполнено
+        поле ключа или поле без null=True (null или отсутствующее поле
+        в JSON, отсутствующая колонка в короткой строке CSV; пустая
+        ячейка не считается незаполненной): такая строка пропускается."""
+
+        if not isinstance(row, dict):
+            return None
+        values = []
+        for field in self.fields:
+            value = row.get(field)
+            if value is not None:
+                values.append(str(value).strip())
+            elif field not in self.key and self.model._meta.get_field(
+                field
+            ).null:
+                values.append(None)
+            else:
+                return None
+        return tuple(values)
+
+    def upsert(self, rows):
+        """Загружает пакет строк. Возвращает число пропущенных строк."""
+
+        cleaned = [
+            values for values in map(self.clean, rows) if values is not None
+        ]
+        skipped = len(rows) - len(cleaned)
+        rows = list(dict(
+            (self.get_key(values), values) for values in cleaned
+        ).values())
+        if not rows:
+            return skipped
+        with transaction.atomic():
+            if connection.vendor == 'postgresql':
+                self.upsert_postgresql(rows)
+            else:
+                self.upsert_generic(rows)
+            DataVersion.objects.bump(self.version_name)
+        return skipped
+
+    def get_key(self, values):
+        return tuple(values[self.fields.index(field)] for field in self.key)
+
+    def upsert_postgresql(self, rows):
+        quote = connection.ops.quote_name
+        table = quote(self.model._meta.db_table)
+        columns = ', '.join(quote(field) for field in self.fields)
+        updates = [field for field in self.fields if field not in self.key]
+        conflict = (
+            'DO UPDATE SET ' + ', '.join(
+                f'{quote(field)} = EXCLUDED.{quote(field)}'
+                for field in updates
+            ) if updates else 'DO NOTHING'
+        )
+        buffer = StringIO()
+        csv.writer(buffer).writerows(rows)
+        buffer.seek(0)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'CREATE TEMP TABLE import_rows ON COMMIT DROP AS '
+                f'SELECT {columns} FROM {table} WITH NO DATA'
+            )
+            cursor.cursor.copy_expert(
+                f'COPY import_rows ({columns}) FROM STDIN WITH (FORMAT csv)',
+                buffer,
+            )
+            cursor.execute(
+                f'INSERT INTO {table} ({columns}) '
+                f'SELECT {columns} FROM import_rows '
+                f'ON CONFLICT ({", ".join(quote(f) for f in self.key)}) '
+                f'{conflict}'
+            )
+
+    def upsert_generic(self, rows):
+        updates = [field for field in self.fields if field not in self.key]
+        objects = [self.model(**dict(zip(self.fields, row))) for row in rows]
+        if not updates:
+            self.model.objects.bulk_create(objects, ignore_conflicts=True)
+            return
+        lookup = {f'{self.key[0]}__in': [
+            getattr(obj, self.key[0]) for obj in objects
+        ]}
+        existing = {
+            tuple(getattr(obj, field) for field in self.key): obj
+            for obj in self.model.objects.filter(**lookup)
+        }
+        to_create, to_update = [], []
+        for obj in objects:
+            current = existing.get(
+                tuple(getattr(obj, field) for field in self.key)
+            )
+            if current is None:
+                to_create.append(obj)
+                continue
+            for field in updates:
+                setattr(current, field, getattr(obj, field))
+            to_update.append(current)
+        self.model.objects.bulk_create(to_create)
+        self.model.objects.bulk_update(to_update, updates)
+
+
+class IngredientUpserter(Upserter):
+    model = Ingredient
+    fields = ('name', 'measurement_unit')
+    key = ('name', 'measurement_unit')
+    version_name = 'ingredients'
+
+
+class TagUpserter(Upserter):
+    model = Tag
+    fields = ('name', 'color', 'slug')
+    key = ('slug',)
+    version_name = 'tags'
+
+
+UPSERTERS = {
+    'ingredient': IngredientUpserter,
+    'tag': TagUpserter,
+}
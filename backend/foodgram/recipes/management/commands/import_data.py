@@ -0,0 +1,93 @@
+import json
+import os
+import time
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError
+from recipes.importers import (UPSERTERS, batched, get_file_format,
+                               iter_rows)
+
+
+class Command(BaseCommand):
+    help = (
+        'Потоковый импорт ингредиентов и тегов из CSV, JSON или NDJSON '
+        'с обновлением существующих записей по естественному ключу'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+')
+        parser.add_argument(
+            '--model',
+            choices=sorted(UPSERTERS),
+            help='По умолчанию определяется по имени файла',
+        )
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--resume',
+            action='store_true',
+            help='Продолжить с места, сохранённого в файле '
+                 '<имя файла>.progress',
+        )
+        parser.add_argument(
+            '--state-dir',
+            help='Каталог для файлов .progress, по умолчанию каталог '
+                 'импортируемого файла',
+        )
+
+    def handle(self, *args, **options):
+        for path in options['paths']:
+            self.import_file(path, options)
+
+    def get_model_name(self, path, model):
+        if model:
+            return model
+        basename = os.path.basename(path).lower()
+        for name in UPSERTERS:
+            if basename.startswith(name):
+                return name
+        raise CommandError(
+            f'Не удалось определить модель для {path}, укажите --model'
+        )
+
+    def import_file(self, path, options):
+        upserter = UPSERTERS[self.get_model_name(path, options['model'])]()
+        progress_path = os.path.join(
+            options['state_dir'] or os.path.dirname(path),
+            f'{os.path.basename(path)}.progress',
+        )
+        skip = 0
+        if options['resume'] and os.path.exists(progress_path):
+            with open(progress_path, encoding='utf8') as file:
+                skip = json.load(file)['rows']
+        started = time.monotonic()
+        imported = skip
+        skipped = 0
+        try:
+            with open(path, encoding='utf8', newline='') as file:
+                rows = islice(
+                    iter_rows(file, get_file_format(path), upserter.fields),
+                    skip,
+                    None,
+                )
+                for batch in batched(rows, options['batch_size']):
+                    skipped += upserter.upsert(batch)
+                    imported += len(batch)
+                    with open(progress_path, 'w', encoding='utf8') as state:
+                        json.dump({'rows': imported}, state)
+                    if options['verbosity'] > 1:
+                        self.stdout.write(f'{path}: {imported}')
+        except (DatabaseError, KeyError, OSError, ValueError) as error:
+            raise CommandError(
+                f'{path}: ошибка после {imported} строк ({error!r}). '
+                f'Повторите команду с --resume, чтобы продолжить'
+            )
+        if os.path.exists(progress_path):
+            os.remove(progress_path)
+        elapsed = time.monotonic() - started
+        count = imported - skip
+        self.stdout.write(self.style.SUCCESS(
+            f'{path}: {count} строк за {elapsed:.1f} с '
+            f'({count / max(elapsed, 1e-6):.0f} строк/с), '
+            f'пропущено с незаполненными полями: {skipped}'
+        ))
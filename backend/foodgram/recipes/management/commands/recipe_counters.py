@@ -0,0 +1,78 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, F, IntegerField, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from recipes.models import Favorite, IngredientRecipe, Recipe, ShoppingCart
+from recipes.signals import refresh_ingredient_ids
+
+COUNTERS = {
+    'ingredients_count': IngredientRecipe,
+    'favorites_count': Favorite,
+    'carts_count': ShoppingCart,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчёт счётчиков рецептов (ingredients_count, favorites_count, '
+        'carts_count) и списков Recipe.ingredient_ids по связанным '
+        'таблицам: нужен после миграции и для исправления расхождений'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Только найти рецепты с неверными счётчиками',
+        )
+
+    def handle(self, *args, **options):
+        live = {
+            field: Coalesce(Subquery(
+                model.objects.filter(
+                    recipe=OuterRef('pk')
+                ).order_by().values('recipe').annotate(
+                    total=Count('id')
+                ).values('total'),
+                output_field=IntegerField(),
+            ), 0)
+            for field, model in COUNTERS.items()
+        }
+        if options['verify']:
+            self.verify(live)
+            return
+        updated = Recipe.objects.update(**live)
+        refresh_ingredient_ids(
+            Recipe.objects.order_by('id').values_list('id', flat=True)
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересчитано рецептов: {updated}'
+        ))
+
+    def verify(self, live):
+        mismatches = Recipe.objects.annotate(**{
+            f'live_{field}': expression for field, expression in live.items()
+        }).filter(
+            self.get_mismatch_lookup()
+        ).values_list(
+            'id', *COUNTERS, *(f'live_{field}' for field in COUNTERS)
+        )
+        count = 0
+        for recipe_id, *values in mismatches.iterator():
+            count += 1
+            stored = dict(zip(COUNTERS, values[:len(COUNTERS)]))
+            actual = dict(zip(COUNTERS, values[len(COUNTERS):]))
+            self.stdout.write(f'recipe={recipe_id}: ' + ', '.join(
+                f'{field} сохранено {stored[field]}, '
+                f'должно быть {actual[field]}'
+                for field in COUNTERS if stored[field] != actual[field]
+            ))
+        if count:
+            raise CommandError(f'Расхождений: {count}')
+        self.stdout.write(self.style.SUCCESS('Счётчики совпадают'))
+
+    @staticmethod
+    def get_mismatch_lookup():
+        lookup = Q()
+        for field in COUNTERS:
+            lookup |= ~Q(**{field: F(f'live_{field}')})
+        return lookup
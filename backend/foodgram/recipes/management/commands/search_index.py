@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+from recipes.models import Recipe
+from recipes.search import index_recipes
+
+
+class Command(BaseCommand):
+    help = 'Перестроение поискового индекса рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        last_id = 0
+        indexed = 0
+        while True:
+            recipe_ids = list(Recipe.objects.filter(
+                id__gt=last_id
+            ).order_by('id').values_list(
+                'id', flat=True
+            )[:options['batch_size']])
+            if not recipe_ids:
+                break
+            index_recipes(recipe_ids)
+            indexed += len(recipe_ids)
+            last_id = recipe_ids[-1]
+        self.stdout.write(self.style.SUCCESS(
+            f'Проиндексировано рецептов: {indexed} '
+            f'({time.monotonic() - started:.1f} с)'
+        ))
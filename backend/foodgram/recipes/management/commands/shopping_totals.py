@@ -0,0 +1,79 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from recipes.models import ShoppingCartIngredient
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчёт сумм ингредиентов в списках покупок '
+        '(ShoppingCartIngredient) по ShoppingCart и IngredientRecipe'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Только сравнить сохранённые суммы с актуальными',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Ограничивается максимумом СУБД: в SQLite не больше '
+                 '999 параметров на запрос',
+        )
+
+    def handle(self, *args, **options):
+        live = {
+            (user_id, ingredient_id): total
+            for user_id, ingredient_id, total
+            in ShoppingCartIngredient.objects.live_totals().iterator()
+        }
+        if options['verify']:
+            self.verify(live)
+            return
+        totals = [
+            ShoppingCartIngredient(
+                user_id=user_id, ingredient_id=ingredient_id, amount=total
+            )
+            for (user_id, ingredient_id), total in live.items()
+        ]
+        # Django 2.2 не ограничивает явный batch_size возможностями СУБД.
+        batch_size = max(min(
+            options['batch_size'],
+            connection.ops.bulk_batch_size(
+                ShoppingCartIngredient._meta.concrete_fields, totals
+            ),
+        ), 1)
+        with transaction.atomic():
+            ShoppingCartIngredient.objects.all().delete()
+            ShoppingCartIngredient.objects.bulk_create(
+                totals, batch_size=batch_size
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Записано сумм: {len(live)}'
+        ))
+
+    def verify(self, live):
+        stored = {
+            (user_id, ingredient_id): amount
+            for user_id, ingredient_id, amount
+            in ShoppingCartIngredient.objects.values_list(
+                'user_id', 'ingredient_id', 'amount'
+            ).iterator()
+        }
+        mismatches = [
+            (key, stored.get(key), live.get(key))
+            for key in stored.keys() | live.keys()
+            if stored.get(key) != live.get(key)
+        ]
+        for (user_id, ingredient_id), stored_amount, live_amount in sorted(
+            mismatches, key=lambda item: item[0]
+        ):
+            self.stdout.write(
+                f'user={user_id} ingredient={ingredient_id}: '
+                f'сохранено {stored_amount}, должно быть {live_amount}'
+            )
+        if mismatches:
+            raise CommandError(f'Расхождений: {len(mismatches)}')
+        self.stdout.write(self.style.SUCCESS('Суммы совпадают'))
@@ -1,6 +1,11 @@
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator, RegexValidator
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import Case, F, Sum, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
 
 User = get_user_model()
 
@@ -12,6 +17,12 @@ class Ingredient(models.Model):
     class Meta:
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['name', 'measurement_unit'],
+                name='unique_ingredient',
+            )
+        ]
 
     def __str__(self):
         return f'{self.id}, {self.name}'
@@ -46,6 +57,37 @@ class Tag(models.Model):
         return self.slug
 
 
+class PostgresGinIndex(GinIndex):
+    """GIN-индекс в PostgreSQL. В остальных СУБД создаётся обычный
+    индекс: поиск там идёт по RecipeSearchTerm, а не по tsvector,
+    подбор по ингредиентам - по IngredientRecipe, а не по массиву."""
+
+    def create_sql(self, model, schema_editor, using=''):
+        if schema_editor.connection.vendor == 'postgresql':
+            return super().create_sql(model, schema_editor, using=using)
+        return models.Index.create_sql(self, model, schema_editor)
+
+
+class IngredientIdsField(models.Field):
+    """Отсортированный список id ингредиентов рецепта: integer[]
+    в PostgreSQL, строка через запятую в остальных СУБД."""
+
+    def db_type(self, connection):
+        if connection.vendor == 'postgresql':
+            return 'integer[]'
+        return 'text'
+
+    def from_db_value(self, value, expression, connection):
+        if value is None or isinstance(value, list):
+            return value
+        return [int(item) for item in value.split(',') if item]
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        if value is None or connection.vendor == 'postgresql':
+            return value
+        return ','.join(map(str, value))
+
+
 class Recipe(models.Model):
     author = models.ForeignKey(
         User,
@@ -66,6 +108,30 @@ class Recipe(models.Model):
         validators=[MinValueValidator(1)],
     )
     pub_date = models.DateTimeField('Дата публикации', auto_now_add=True)
+    ingredients_count = models.PositiveSmallIntegerField(
+        'Количество ингредиентов', default=0, editable=False
+    )
+    favorites_count = models.PositiveIntegerField(
+        'В избранном', default=0, editable=False
+    )
+    carts_count = models.PositiveIntegerField(
+        'В списках покупок', default=0, editable=False
+    )
+    # Формат и размеры уже созданных уменьшенных копий изображения
+    # (api.images.get_renditions_key), пусто - копий ещё нет.
+    image_renditions = models.CharField(
+        'Копии изображения', max_length=64, blank=True, default='',
+        editable=False,
+    )
+    # Копия id из IngredientRecipe для подбора рецептов по имеющимся
+    # ингредиентам (api.common.rank_by_ingredients) без соединения
+    # и группировки.
+    ingredient_ids = IngredientIdsField(
+        'Id ингредиентов', default=list, editable=False
+    )
+    search_vector = SearchVectorField(
+        'Поисковый вектор', null=True, editable=False
+    )
     ingredient = models.ManyToManyField(
         Ingredient,
         through='IngredientRecipe',
@@ -81,11 +147,55 @@ class Recipe(models.Model):
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ('-pub_date',)
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'],
+                name='recipe_pub_date_idx',
+            ),
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='recipe_author_pub_date_idx',
+            ),
+            models.Index(
+                fields=[
+                    '-favorites_count', '-carts_count', '-pub_date', '-id'
+                ],
+                name='recipe_popular_idx',
+            ),
+            PostgresGinIndex(
+                fields=['search_vector'],
+                name='recipe_search_vector_idx',
+            ),
+            PostgresGinIndex(
+                fields=['ingredient_ids'],
+                name='recipe_ingredient_ids_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.name
 
 
+class RecipeSearchTerm(models.Model):
+    """Обратный индекс слов рецепта для СУБД без полнотекстового
+    поиска (SQLite). weight - суммарный вес вхождений слова."""
+
+    term = models.CharField('Слово', max_length=64)
+    recipe = models.ForeignKey(
+        Recipe,
+        related_name='search_terms',
+        on_delete=models.CASCADE,
+    )
+    weight = models.PositiveIntegerField('Вес')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['term', 'recipe'], name='unique_search_term'
+            )
+        ]
+
+
 class TagRecipe(models.Model):
     recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE)
     tag = models.ForeignKey(Tag, on_delete=models.CASCADE)
@@ -96,6 +206,9 @@ class TagRecipe(models.Model):
                 fields=['recipe', 'tag'], name='unique_tag_for_recipe'
             )
         ]
+        indexes = [
+            models.Index(fields=['tag', 'recipe'], name='tag_recipe_idx'),
+        ]
 
 
 class IngredientRecipe(models.Model):
@@ -118,6 +231,12 @@ class IngredientRecipe(models.Model):
                 name='unique_ingredient_for_recipe',
             )
         ]
+        indexes = [
+            models.Index(
+                fields=['ingredient', 'recipe'],
+                name='ingredient_recipe_idx',
+            ),
+        ]
 
     def __str__(self):
         return (f'{self.recipe.name}: '
@@ -178,3 +297,145 @@ class ShoppingCart(models.Model):
 
     def __str__(self):
         return f'{self.user} - {self.recipe}'
+
+
+class ShoppingCartIngredientManager(models.Manager):
+
+    def apply_delta(self, user_ids, delta):
+        """Изменяет суммы ингредиентов в списках покупок пользователей.
+        delta - словарь {id ингредиента: изменение количества}.
+
+        Недостающие строки создаются с нулём, конфликт с такой же
+        строкой параллельного запроса игнорируется. Затем все суммы
+        меняются одним UPDATE через F(), а нулевые удаляются."""
+
+        delta = {key: value for key, value in delta.items() if value}
+        if not user_ids or not delta:
+            return
+        totals = self.filter(user_id__in=user_ids, ingredient_id__in=delta)
+        with transaction.atomic():
+            self.bulk_create(
+                [
+                    self.model(
+                        user_id=user_id, ingredient_id=ingredient_id, amount=0
+                    )
+                    for user_id in user_ids
+                    for ingredient_id, amount in delta.items()
+                    if amount > 0
+                ],
+                ignore_conflicts=True,
+            )
+            totals.update(amount=Greatest(F('amount') + Case(
+                *(
+                    When(ingredient_id=ingredient_id, then=Value(amount))
+                    for ingredient_id, amount in delta.items()
+                ),
+                output_field=models.IntegerField(),
+            ), 0))
+            totals.filter(amount=0).delete()
+
+    def add_recipe(self, user_ids, recipe_id, sign=1):
+        """Добавляет (sign=1) или вычитает (sign=-1) ингредиенты рецепта
+        из списков покупок пользователей."""
+
+        self.apply_delta(user_ids, {
+            ingredient_id: sign * amount
+            for ingredient_id, amount in IngredientRecipe.objects.filter(
+                recipe_id=recipe_id
+            ).values_list('ingredient_id', 'amount')
+        })
+
+    def live_totals(self):
+        """Суммы, посчитанные напрямую по ShoppingCart и IngredientRecipe:
+        кортежи (id пользователя, id ингредиента, количество)."""
+
+        return IngredientRecipe.objects.filter(
+            recipe__shoppings__isnull=False
+        ).values_list(
+            'recipe__shoppings__user', 'ingredient'
+        ).annotate(
+            total=Sum('amount')
+        ).order_by()
+
+
+class ShoppingCartIngredient(models.Model):
+    """Суммарное количество ингредиента в списке покупок пользователя."""
+
+    user = models.ForeignKey(
+        User,
+        related_name='shopping_totals',
+        on_delete=models.CASCADE,
+        verbose_name='Пользователь',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        related_name='shopping_totals',
+        on_delete=models.CASCADE,
+        verbose_name='Ингредиент',
+    )
+    amount = models.PositiveIntegerField('Количество')
+
+    objects = ShoppingCartIngredientManager()
+
+    class Meta:
+        verbose_name = 'Ингредиент в списке покупок'
+        verbose_name_plural = 'Ингредиенты в списках покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shopping_cart_ingredient',
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.user} - {self.ingredient}: {self.amount}'
+
+
+class DataVersionManager(models.Manager):
+
+    def bump(self, *names):
+        """Увеличивает версии наборов данных names."""
+
+        for name in names:
+            updated = self.filter(name=name).update(
+                version=F('version') + 1,
+                modified=timezone.now(),
+            )
+            if updated:
+                continue
+            try:
+                with transaction.atomic():
+                    self.create(name=name, version=1)
+            except IntegrityError:
+                self.bump(name)
+
+    def get_versions(self, names):
+        """Словарь {название: (версия, время изменения)}, для ещё
+        не изменявшихся наборов - (0, None)."""
+
+        versions = dict.fromkeys(names, (0, None))
+        versions.update(
+            (name, (version, modified))
+            for name, version, modified in self.filter(
+                name__in=names
+            ).values_list('name', 'version', 'modified')
+        )
+        return versions
+
+
+class DataVersion(models.Model):
+    """Счётчик изменений набора данных (тэги, ингредиенты, рецепты,
+    состояние пользователя) для условных GET-запросов и кэшей."""
+
+    name = models.CharField('Название', max_length=64, primary_key=True)
+    version = models.BigIntegerField('Версия', default=0)
+    modified = models.DateTimeField('Изменено', auto_now=True)
+
+    objects = DataVersionManager()
+
+    class Meta:
+        verbose_name = 'Версия данных'
+        verbose_name_plural = 'Версии данных'
+
+    def __str__(self):
+        return f'{self.name}: {self.version}'
@@ -0,0 +1,137 @@
+import re
+from collections import defaultdict
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection, transaction
+from django.db.models import F, FloatField, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Cast
+
+from .models import IngredientRecipe, Recipe, RecipeSearchTerm
+
+TOKEN_RE = re.compile(r'\w+')
+MAX_TERM_LENGTH = RecipeSearchTerm._meta.get_field('term').max_length
+
+# Веса как у setweight в PostgreSQL: название важнее ингредиентов,
+# ингредиенты важнее описания.
+NAME_WEIGHT = 3
+INGREDIENT_WEIGHT = 2
+TEXT_WEIGHT = 1
+
+POSTGRESQL_INDEX_SQL = '''
+UPDATE {recipe} SET search_vector =
+    setweight(to_tsvector(%(config)s::regconfig, {recipe}.name), 'A')
+    || setweight(to_tsvector(%(config)s::regconfig, coalesce((
+        SELECT string_agg(ingredient.name, ' ')
+        FROM {ingredient_recipe} ingredient_recipe
+        JOIN {ingredient} ingredient
+            ON ingredient.id = ingredient_recipe.ingredient_id
+        WHERE ingredient_recipe.recipe_id = {recipe}.id
+    ), '')), 'B')
+    || setweight(to_tsvector(%(config)s::regconfig, {recipe}.text), 'C')
+WHERE {recipe}.id = ANY(%(ids)s)
+'''
+
+
+def get_tokens(text):
+    return [
+        token[:MAX_TERM_LENGTH] for token in TOKEN_RE.findall(text.lower())
+    ]
+
+
+def index_recipes(recipe_ids):
+    """Обновляет поисковый индекс рецептов: tsvector в PostgreSQL,
+    RecipeSearchTerm в остальных СУБД."""
+
+    recipe_ids = list(recipe_ids)
+    if not recipe_ids:
+        return
+    if connection.vendor == 'postgresql':
+        index_recipes_postgresql(recipe_ids)
+    else:
+        index_recipes_terms(recipe_ids)
+
+
+def index_recipes_postgresql(recipe_ids):
+    quote = connection.ops.quote_name
+    sql = POSTGRESQL_INDEX_SQL.format(
+        recipe=quote(Recipe._meta.db_table),
+        ingredient_recipe=quote(IngredientRecipe._meta.db_table),
+        ingredient=quote(
+            IngredientRecipe._meta.get_field('ingredient')
+            .related_model._meta.db_table
+        ),
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, {
+            'config': settings.RECIPE_SEARCH_CONFIG,
+            'ids': recipe_ids,
+        })
+
+
+def index_recipes_terms(recipe_ids):
+    weights = defaultdict(int)
+    for recipe_id, name, text in Recipe.objects.filter(
+        id__in=recipe_ids
+    ).values_list('id', 'name', 'text'):
+        for term in get_tokens(name):
+            weights[(recipe_id, term)] += NAME_WEIGHT
+        for term in get_tokens(text):
+            weights[(recipe_id, term)] += TEXT_WEIGHT
+    for recipe_id, name in IngredientRecipe.objects.filter(
+        recipe_id__in=recipe_ids
+    ).values_list('recipe_id', 'ingredient__name'):
+        for term in get_tokens(name):
+            weights[(recipe_id, term)] += INGREDIENT_WEIGHT
+    with transaction.atomic():
+        RecipeSearchTerm.objects.filter(recipe_id__in=recipe_ids).delete()
+        RecipeSearchTerm.objects.bulk_create(
+            RecipeSearchTerm(recipe_id=recipe_id, term=term, weight=weight)
+            for (recipe_id, term), weight in weights.items()
+        )
+
+
+def get_term_lookup(token):
+    """Слова с префиксом token. Сравнение по диапазону, в отличие
+    от LIKE, использует индекс unique_search_term."""
+
+    return Q(term__gte=token, term__lt=token + '\uffff')
+
+
+def search_recipes(queryset, value):
+    """Рецепты, в которых есть слова, начинающиеся с каждого слова
+    запроса, упорядоченные по релевантности search_rank."""
+
+    tokens = get_tokens(value)
+    if not tokens:
+        return queryset
+    if connection.vendor == 'postgresql':
+        query = SearchQuery(
+            ' & '.join(f'{token}:*' for token in tokens),
+            config=settings.RECIPE_SEARCH_CONFIG,
+            search_type='raw',
+        )
+        # ts_rank возвращает real: приведение к double precision
+        # сохраняет точное значение в курсоре пагинации по ключу.
+        queryset = queryset.filter(search_vector=query).annotate(
+            search_rank=Cast(
+                SearchRank(F('search_vector'), query), FloatField()
+            )
+        )
+    else:
+        for token in tokens:
+            queryset = queryset.filter(id__in=RecipeSearchTerm.objects.filter(
+                get_term_lookup(token)
+            ).values('recipe'))
+        rank = RecipeSearchTerm.objects.filter(
+            reduce(or_, map(get_term_lookup, tokens)),
+            recipe=OuterRef('pk'),
+        ).order_by().values('recipe').annotate(
+            total=Sum('weight')
+        ).values('total')
+        queryset = queryset.annotate(
+            search_rank=Subquery(rank, output_field=FloatField())
+        )
+    return queryset.order_by('-search_rank', '-pub_date', '-id')
@@ -0,0 +1,206 @@
+import threading
+
+from django.contrib.auth import get_user_model
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from users.models import Follow
+
+from .models import (DataVersion, Favorite, Ingredient, IngredientRecipe,
+                     Recipe, ShoppingCart, ShoppingCartIngredient, Tag)
+from .search import index_recipes
+
+User = get_user_model()
+
+# Рецепты, которые сейчас удаляются в этом потоке: их ингредиенты уже
+# вычтены из списков покупок, каскадное удаление ShoppingCart не должно
+# вычитать их ещё раз.
+_deleting = threading.local()
+
+RECIPE_COUNTERS = {
+    Favorite: 'favorites_count',
+    ShoppingCart: 'carts_count',
+}
+
+INGREDIENT_IDS_BATCH_SIZE = 500
+
+VERSION_NAMES = {
+    Tag: 'tags',
+    Ingredient: 'ingredients',
+    User: 'users',
+}
+
+
+def get_user_version_name(user_id):
+    return f'user:{user_id}'
+
+
+def get_tag_version_name(slug):
+    return f'recipes:tag:{slug}'
+
+
+def bump_recipe_versions(recipe_ids):
+    """Изменение рецептов: версия 'recipes' и версии их тэгов."""
+
+    slugs = Tag.objects.filter(
+        tagrecipe__recipe__in=recipe_ids
+    ).values_list('slug', flat=True).distinct()
+    DataVersion.objects.bump(
+        'recipes', *(get_tag_version_name(slug) for slug in slugs)
+    )
+
+
+def bump_tag_versions(tag_ids):
+    """Версии страниц тэгов tag_ids без общей версии 'recipes'."""
+
+    if tag_ids:
+        DataVersion.objects.bump(*(
+            get_tag_version_name(slug) for slug in Tag.objects.filter(
+                id__in=tag_ids
+            ).values_list('slug', flat=True)
+        ))
+
+
+@receiver((post_save, post_delete), sender=Tag)
+@receiver((post_save, post_delete), sender=Ingredient)
+@receiver((post_save, post_delete), sender=User)
+def bump_data_version(sender, created=False, update_fields=None, **kwargs):
+    if sender is User and (
+        created or update_fields == frozenset(('last_login',))
+    ):
+        return
+    DataVersion.objects.bump(VERSION_NAMES[sender])
+
+
+@receiver(post_save, sender=Recipe)
+def update_recipe(instance, created=False, **kwargs):
+    """Изменённый рецепт переиндексируется и увеличивает версии.
+    Новый рецепт - в create_recipe_relations, один раз после создания
+    его ингредиентов и тэгов."""
+
+    if created:
+        return
+    bump_recipe_versions((instance.id,))
+    index_recipes((instance.id,))
+
+
+@receiver(pre_delete, sender=Recipe)
+def bump_recipe_version(instance, **kwargs):
+    bump_recipe_versions((instance.id,))
+
+
+@receiver(post_save, sender=Ingredient)
+def index_ingredient_recipes(instance, created=False, **kwargs):
+    if created:
+        return
+    index_recipes(IngredientRecipe.objects.filter(
+        ingredient=instance
+    ).values_list('recipe_id', flat=True))
+
+
+@receiver((post_save, post_delete), sender=Favorite)
+@receiver((post_save, post_delete), sender=ShoppingCart)
+@receiver((post_save, post_delete), sender=Follow)
+def bump_user_version(instance, **kwargs):
+    DataVersion.objects.bump(get_user_version_name(instance.user_id))
+
+
+def refresh_ingredient_ids(recipe_ids, exclude_ingredient_id=None):
+    """Пересчитывает Recipe.ingredient_ids по IngredientRecipe,
+    без ингредиента exclude_ingredient_id, который сейчас удаляется."""
+
+    recipe_ids = list(recipe_ids)
+    for start in range(0, len(recipe_ids), INGREDIENT_IDS_BATCH_SIZE):
+        batch = recipe_ids[start:start + INGREDIENT_IDS_BATCH_SIZE]
+        ingredient_ids = {recipe_id: [] for recipe_id in batch}
+        rows = IngredientRecipe.objects.filter(recipe_id__in=batch)
+        if exclude_ingredient_id is not None:
+            rows = rows.exclude(ingredient_id=exclude_ingredient_id)
+        for recipe_id, ingredient_id in rows.order_by(
+            'ingredient_id'
+        ).values_list('recipe_id', 'ingredient_id'):
+            ingredient_ids[recipe_id].append(ingredient_id)
+        Recipe.objects.bulk_update([
+            Recipe(id=recipe_id, ingredient_ids=ids)
+            for recipe_id, ids in ingredient_ids.items()
+        ], ['ingredient_ids'])
+
+
+@receiver(pre_delete, sender=Ingredient)
+def decrease_ingredients_count(instance, **kwargs):
+    Recipe.objects.filter(recipes__ingredient=instance).update(
+        ingredients_count=F('ingredients_count') - 1
+    )
+    refresh_ingredient_ids(
+        IngredientRecipe.objects.filter(
+            ingredient=instance
+        ).values_list('recipe_id', flat=True),
+        exclude_ingredient_id=instance.id,
+    )
+
+
+def get_deleting_recipe_ids():
+    if not hasattr(_deleting, 'recipe_ids'):
+        _deleting.recipe_ids = set()
+    return _deleting.recipe_ids
+
+
+@receiver(post_save, sender=ShoppingCart)
+def add_shopping_totals(instance, created=False, raw=False, **kwargs):
+    if created and not raw:
+        ShoppingCartIngredient.objects.add_recipe(
+            (instance.user_id,), instance.recipe_id
+        )
+
+
+@receiver(post_delete, sender=ShoppingCart)
+def subtract_shopping_totals(instance, **kwargs):
+    if instance.recipe_id in get_deleting_recipe_ids():
+        return
+    ShoppingCartIngredient.objects.add_recipe(
+        (instance.user_id,), instance.recipe_id, sign=-1
+    )
+
+
+@receiver(pre_delete, sender=Recipe)
+def subtract_recipe_shopping_totals(instance, **kwargs):
+    """Ингредиенты удаляемого рецепта вычитаются из списков покупок
+    до каскадного удаления: после него IngredientRecipe уже нет."""
+
+    ShoppingCartIngredient.objects.add_recipe(
+        tuple(instance.shoppings.values_list('user_id', flat=True)),
+        instance.id,
+        sign=-1,
+    )
+    get_deleting_recipe_ids().add(instance.id)
+
+
+@receiver(post_delete, sender=Recipe)
+def forget_deleted_recipe(instance, **kwargs):
+    get_deleting_recipe_ids().discard(instance.id)
+
+
+def change_recipe_counter(recipe_id, field, sign):
+    """Атомарно меняет счётчик рецепта на sign, не опуская его ниже нуля:
+    до пересчёта recipe_counters счётчики старых рецептов равны нулю."""
+
+    Recipe.objects.filter(id=recipe_id).update(
+        **{field: Greatest(F(field) + sign, 0)}
+    )
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+def increase_recipe_counter(sender, instance, created=False, raw=False,
+                            **kwargs):
+    if created and not raw:
+        change_recipe_counter(instance.recipe_id, RECIPE_COUNTERS[sender], 1)
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingCart)
+def decrease_recipe_counter(sender, instance, **kwargs):
+    if instance.recipe_id in get_deleting_recipe_ids():
+        return
+    change_recipe_counter(instance.recipe_id, RECIPE_COUNTERS[sender], -1)